@@ -1,27 +1,157 @@
-import subprocess
+import importlib.util
 import os
+from functools import partial
+
+import pandas as pd
+
+from incremental import reconcile_incrementally
+from input_loading import (PASSTHROUGH_DATA, add_index, attach_passthrough, compact_matching_data, load_matching_lombard,
+                           load_matching_saiba, load_passthrough, read_lombard, read_saiba)
+from instrumentation import finish_run, note, stage, start_run
+from io_scheduler import IOScheduler
+from match_annotation import annotate_matches
+from name_aliases import close_alias_store, open_alias_store
+from name_normalizer import load_name_cache, save_name_cache
+from output_export import export_outputs, write_dataset
+from settings import load_settings
+from workbook_io import LOMBARD_SHEET, SAIBA_SHEET, save_working_data, working_path
 
 # Directory containing the Python script files
-script_dir = r'C:\Users\ahmed\OneDrive\Desktop\Clapgrow-Salasar_Lombard-Reconciliation'
+script_dir = os.path.dirname(os.path.abspath(__file__))
 
-# List of Python script filenames
+# List of Python script filenames and the stage function each one provides
 scripts = [
-    'Pol_no+End_no.py',
-    'Customer+Policy+Premium.py',
-    'Customer+Premium+Tenure.py'
+    ('Pol_no+End_no.py', 'match_policy_numbers'),
+    ('Customer+Policy+Premium.py', 'match_customer_policy_premium'),
+    ('Customer+Premium+Tenure.py', 'match_customer_premium_tenure')
 ]
 
+# Stage scripts already imported, by file name
+stage_modules = {}
+
+
+def load_script(script):
+    # Import a stage script by path, its file name is not a valid module name; each one once
+    if script not in stage_modules:
+        spec = importlib.util.spec_from_file_location(os.path.splitext(script)[0], os.path.join(script_dir, script))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        stage_modules[script] = module
+    return stage_modules[script]
+
+def run_stages(data1, data2, settings):
+    # Keep matched and unmatched data in memory from one stage to the next
+    mdata1 = mdata2 = None
+    for script, stage_name in scripts:
+        print(f"Executing {script}...")
+        stage_function = getattr(load_script(script), stage_name)
+        with stage(stage_name):
+            unmatched_rows = len(data1) + len(data2)
+            if mdata1 is None:
+                mdata1, mdata2, data1, data2 = stage_function(data1, data2)
+            else:
+                mdata1, mdata2, data1, data2 = stage_function(mdata1, mdata2, data1, data2, settings)
+            note(input_rows=unmatched_rows, rows_matched=unmatched_rows - len(data1) - len(data2))
+        print(f"Finished executing {script}")
+    return mdata1, mdata2, data1, data2
+
+# One stage on its own, returning only the rows it matched
+def run_stage(settings, number, data1, data2):
+    script, stage_name = scripts[number]
+    stage_function = getattr(load_script(script), stage_name)
+    with stage(stage_name):
+        if number == 0:
+            mdata1, mdata2, _, _ = stage_function(data1, data2)
+        else:
+            mdata1, mdata2, _, _ = stage_function(*annotate_matches(data1.iloc[:0], data2.iloc[:0], [], [], '', ''),
+                                                  data1, data2, settings)
+        note(input_rows=len(data1) + len(data2), rows_matched=len(mdata1) + len(mdata2))
+    return mdata1, mdata2
+
+# Both inputs are parsed at once, each of them once. With projected loading
+# the columns the stages do not need wait in working files until the outputs.
+def read_inputs(io, file_path1, file_path2, settings):
+    # A Saiba dump already in memory is not sent to a worker and back
+    local = isinstance(file_path1, pd.DataFrame)
+    if settings['projected_loading']:
+        passthrough = [os.path.abspath(working_path(PASSTHROUGH_DATA, sheet)) for sheet in (SAIBA_SHEET, LOMBARD_SHEET)]
+        matching = [io.read(load_matching_saiba, file_path1, passthrough[0], local=local),
+                    io.read(load_matching_lombard, file_path2, passthrough[1])]
+        return [future.result() for future in matching], passthrough
+    inputs = [io.read(read_saiba, file_path1, local=local), io.read(read_lombard, file_path2)]
+    return [add_index(future.result()) for future in inputs], None
 
-def execute_script(script_path):
-    # Execute the Python script
-    subprocess.run(['python', script_path], check=True)
+# Every output is written to the current directory. file_path1 may also be a
+# Saiba dump already read with read_saiba, to share one dump between runs.
+# Without settings, Reconciliation_Settings.json of the current directory is read.
+def run_pipeline(file_path1, file_path2, settings=None):
+    if settings is None:
+        settings = load_settings()
+    if settings['run_report']:
+        start_run(settings['profile_stage'])
 
+    with IOScheduler(settings['io_workers'], settings['io_queue_size']) as io:
+        with stage('read_inputs'):
+            (broker_data, company_data), passthrough = read_inputs(io, file_path1, file_path2, settings)
+            note(input_rows=len(broker_data) + len(company_data))
+
+        if settings['projected_loading'] and settings['compact_frames']:
+            with stage('compact_frames'):
+                broker_data, company_data = compact_matching_data(broker_data, company_data)
+
+        load_name_cache(settings['name_cache_file'])
+        if settings['alias_store']:
+            open_alias_store(settings['alias_store'])
+        if settings['incremental_state']:
+            # Only match rows that are new or changed since the previous run; the new and
+            # reused row counts go to the run report
+            with stage('incremental_run'):
+                broker_data, company_data, mdata1, mdata2, data1, data2 = reconcile_incrementally(
+                    broker_data, company_data, partial(run_stage, settings), len(scripts),
+                    settings['incremental_state'], settings['pair_assignment'] == 'all')
+        else:
+            mdata1, mdata2, data1, data2 = run_stages(broker_data, company_data, settings)
+        save_name_cache(settings['name_cache_file'])
+        close_alias_store()
+
+        if passthrough is not None:
+            # Bring back the columns the stages did not need, by source row
+            with stage('read_passthrough'):
+                passthrough1, passthrough2 = [load_passthrough(path) for path in passthrough]
+            broker_data, mdata1, data1 = [attach_passthrough(df, passthrough1) for df in (broker_data, mdata1, data1)]
+            company_data, mdata2, data2 = [attach_passthrough(df, passthrough2) for df in (company_data, mdata2, data2)]
+
+        outputs = {
+            'Combined_Data': (broker_data, company_data),
+            'Matched_Data': (mdata1, mdata2),
+            'Unmatched_Data': (data1, data2),
+        }
+        if io.executor is None:
+            # Keep columnar working copies for reloading a single stage later
+            with stage('save_working_data'):
+                for name, (saiba_data, lombard_data) in outputs.items():
+                    save_working_data(name, saiba_data, lombard_data)
+
+            # Export once, after every stage has run
+            with stage('export'):
+                export_outputs(outputs, settings['export_formats'], settings['export_workers'])
+                note(matched_rows=len(mdata1) + len(mdata2), unmatched_rows=len(data1) + len(data2))
+        else:
+            # Working copies and exports are written by the I/O workers, one job per dataset
+            with stage('export'):
+                for name, (saiba_data, lombard_data) in outputs.items():
+                    io.write(write_dataset, name, saiba_data, lombard_data, settings['export_formats'])
+                io.close()
+                note(matched_rows=len(mdata1) + len(mdata2), unmatched_rows=len(data1) + len(data2))
+
+    if settings['run_report']:
+        finish_run(settings['run_report'])
+    return mdata1, mdata2, data1, data2
 
 if __name__ == "__main__":
     # Change the current working directory to the script directory
     os.chdir(script_dir)
 
-    for script in scripts:
-        print(f"Executing {script}...")
-        execute_script(script)
-        print(f"Finished executing {script}")
\ No newline at end of file
+    file_path1, file_path2 = load_script(scripts[0][0]).select_excel_files()
+    if file_path1 and file_path2:
+        run_pipeline(file_path1, file_path2, load_settings())
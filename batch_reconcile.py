@@ -0,0 +1,170 @@
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+
+import Lombard_Saiba_Code as runner
+from input_loading import read_saiba
+from settings import SETTINGS_FILE, load_settings
+
+# Headless reconciliation of one or many (Saiba dump, Lombard statement) pairs.
+#
+# The pipeline writes its outputs, working files and incremental state to the
+# current directory, so every job runs inside its own output directory and
+# concurrent jobs never overwrite each other's Matched_Data.xlsx. The name
+# cache, compatibility table and alias store are shared by every job and
+# batch: their paths are resolved against the directory of --settings and
+# written into each job's settings as absolute paths. Jobs run in separate processes.
+
+# Manifest columns: Saiba dump and Lombard statement paths, and an optional
+# job name (its output subdirectory). 'saiba' may be left out when --saiba is given.
+MANIFEST_COLUMNS = ['saiba', 'lombard', 'name']
+
+# Written in every job directory, and the summary of all jobs in the output directory
+JOB_LOG = 'Reconciliation.log'
+BATCH_SUMMARY = 'Batch_Summary.json'
+
+# Saiba dumps shared by several jobs, parsed once and keyed by absolute path;
+# set in every worker process by the pool initializer
+saiba_dumps = {}
+
+
+# #### Jobs
+
+def read_manifest(path, default_saiba=None):
+    # Relative paths in the manifest are relative to the manifest itself
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        unknown = sorted(set(reader.fieldnames or []) - set(MANIFEST_COLUMNS))
+        if unknown:
+            raise ValueError(f"Unknown manifest columns in {path}: {', '.join(unknown)}")
+        rows = list(reader)
+
+    jobs = []
+    for number, row in enumerate(rows, 1):
+        saiba = (row.get('saiba') or '').strip() or default_saiba
+        lombard = (row.get('lombard') or '').strip()
+        if not saiba or not lombard:
+            raise ValueError(f"Manifest row {number} needs both a Saiba dump and a Lombard statement")
+        lombard = os.path.join(base_dir, lombard)
+        name = (row.get('name') or '').strip() or f"{number:03d}_{os.path.splitext(os.path.basename(lombard))[0]}"
+        jobs.append({'name': name, 'saiba': os.path.abspath(os.path.join(base_dir, saiba)),
+                     'lombard': os.path.abspath(lombard)})
+
+    names = [job['name'] for job in jobs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Duplicate job names in {path}: {', '.join(duplicates)}")
+    return jobs
+
+def prepare_job_directory(directory, settings):
+    # Every job reads the same settings from its own directory
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, SETTINGS_FILE), 'w', encoding='utf-8') as f:
+        json.dump(settings, f, indent=2)
+
+def init_worker(dumps):
+    saiba_dumps.update(dumps)
+
+def run_job(job):
+    result = {'name': job['name'], 'output_dir': job['output_dir'], 'status': 'ok'}
+    start = time.perf_counter()
+    cwd = os.getcwd()
+    try:
+        os.chdir(job['output_dir'])
+        with open(JOB_LOG, 'w', encoding='utf-8') as log, redirect_stdout(log):
+            try:
+                mdata1, mdata2, data1, data2 = runner.run_pipeline(
+                    saiba_dumps.get(job['saiba'], job['saiba']), job['lombard'], load_settings())
+                result.update(matched_rows=len(mdata1) + len(mdata2), unmatched_rows=len(data1) + len(data2))
+            except Exception as exc:
+                traceback.print_exc(file=log)
+                result.update(status='failed', error=f"{type(exc).__name__}: {exc}")
+    finally:
+        os.chdir(cwd)
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    return result
+
+def read_shared_dumps(jobs):
+    # Parse every Saiba dump used by more than one job once, here, instead of in each job
+    paths = [job['saiba'] for job in jobs]
+    dumps, errors = {}, {}
+    for path in sorted({path for path in paths if paths.count(path) > 1}):
+        print(f"Reading {path}...")
+        try:
+            dumps[path] = read_saiba(path)
+        except Exception as exc:
+            errors[path] = f"{type(exc).__name__}: {exc}"
+    return dumps, errors
+
+def run_batch(jobs, output_dir, settings, workers=1):
+    # Several jobs at once share the cores, so each one reads, scores names and exports serially
+    workers = min(workers if workers > 0 else os.cpu_count() or 1, len(jobs))
+    if workers > 1:
+        settings = dict(settings, scoring_workers=1, export_workers=1, io_workers=1)
+    for job in jobs:
+        prepare_job_directory(job['output_dir'], settings)
+
+    dumps, errors = read_shared_dumps(jobs)
+    results = [{'name': job['name'], 'output_dir': job['output_dir'], 'status': 'failed',
+                'error': errors[job['saiba']]} for job in jobs if job['saiba'] in errors]
+    jobs = [job for job in jobs if job['saiba'] not in errors]
+
+    if workers <= 1:
+        init_worker(dumps)
+        for job in jobs:
+            results.append(run_job(job))
+            report_job(results[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(dumps,)) as executor:
+            for result in executor.map(run_job, jobs):
+                results.append(result)
+                report_job(result)
+
+    with open(os.path.join(output_dir, BATCH_SUMMARY), 'w', encoding='utf-8') as f:
+        json.dump({'workers': workers, 'jobs': results}, f, indent=2)
+    return results
+
+def report_job(result):
+    if result['status'] == 'ok':
+        print(f"{result['name']}: {result['matched_rows']} matched, {result['unmatched_rows']} unmatched rows "
+              f"in {result['seconds']}s -> {result['output_dir']}")
+    else:
+        print(f"{result['name']}: FAILED ({result['error']}), see {os.path.join(result['output_dir'], JOB_LOG)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile Saiba dumps with Lombard statements without the file dialog")
+    parser.add_argument('--saiba', help="Saiba dump; with --manifest, used for rows that leave 'saiba' empty")
+    parser.add_argument('--lombard', help="Lombard statement, for a single reconciliation")
+    parser.add_argument('--manifest', help="CSV of jobs with columns saiba, lombard and an optional name")
+    parser.add_argument('--output-dir', required=True,
+                        help="directory for the outputs; with --manifest every job gets a subdirectory named after it")
+    parser.add_argument('--settings', default=SETTINGS_FILE, help="settings file used by every job")
+    parser.add_argument('--workers', type=int, default=1, help="jobs run at once (0 = every core)")
+    args = parser.parse_args()
+
+    output_dir = os.path.abspath(args.output_dir)
+    if args.manifest:
+        if args.lombard:
+            parser.error("--lombard cannot be combined with --manifest")
+        jobs = read_manifest(args.manifest, args.saiba and os.path.abspath(args.saiba))
+        for job in jobs:
+            job['output_dir'] = os.path.join(output_dir, job['name'])
+    elif args.saiba and args.lombard:
+        jobs = [{'name': os.path.splitext(os.path.basename(args.lombard))[0], 'output_dir': output_dir,
+                 'saiba': os.path.abspath(args.saiba), 'lombard': os.path.abspath(args.lombard)}]
+    else:
+        parser.error("give --saiba and --lombard, or --manifest")
+    if not jobs:
+        parser.error("the manifest has no jobs")
+
+    os.makedirs(output_dir, exist_ok=True)
+    results = run_batch(jobs, output_dir, load_settings(args.settings), args.workers)
+    sys.exit(0 if all(result['status'] == 'ok' for result in results) else 1)
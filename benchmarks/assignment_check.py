@@ -0,0 +1,58 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from input_loading import add_index, read_lombard, read_saiba
+from match_planner import match_rule
+from pair_assignment import ASSIGNMENT_MODES, assign_pairs
+from planner_equivalence import rules
+from synthetic_data import generate_pair
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Check of the pair assignment modes of the customer stages.
+#
+# Both customer rules are run on the sample files and on synthetic inputs.
+# In every mode the kept pairs must be pairs that passed the checks, and in
+# 'best' and 'one_to_one' no Saiba or Lombard row may keep more than one
+# partner. The pairs kept per mode are reported.
+SINGLE_PARTNER_MODES = ['best', 'one_to_one']
+
+def most_partners(rows):
+    return int(np.bincount(rows).max()) if len(rows) else 0
+
+def check_modes(name, data1, data2):
+    failed = False
+    for rule, predicates in rules(0.02, 0, 0, 0).items():
+        pairs = match_rule(data1, data2, predicates)
+        passed = set(zip(pairs.left.tolist(), pairs.right.tolist()))
+        counts = []
+        for mode in ASSIGNMENT_MODES:
+            kept = assign_pairs(data1, data2, pairs, mode)
+            partners = max(most_partners(kept.left), most_partners(kept.right))
+            wrong = (not set(zip(kept.left.tolist(), kept.right.tolist())) <= passed
+                     or (mode in SINGLE_PARTNER_MODES and partners > 1))
+            failed = failed or wrong
+            counts.append(f"{mode} {len(kept)} (up to {partners} per row){' WRONG' if wrong else ''}")
+        print(f"{name:10} {rule:24} {', '.join(counts)}")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that 'best' and 'one_to_one' keep one partner per row")
+    parser.add_argument('rows', type=int, nargs='?', default=5000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    sample = (add_index(read_saiba(os.path.join(REPO_DIR, 'Saiba_Dump.xls'))),
+              add_index(read_lombard(os.path.join(REPO_DIR, 'Lombard_Statement.xlsx'))))
+    synthetic = [add_index(df) for df in generate_pair(args.rows, args.seed)]
+
+    failed = check_modes('sample', *sample)
+    failed = check_modes('synthetic', *synthetic) or failed
+    sys.exit(1 if failed else 0)
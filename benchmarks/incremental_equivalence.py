@@ -0,0 +1,119 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import Lombard_Saiba_Code as runner
+from input_loading import LOMBARD_READ_OPTIONS, read_lombard, read_saiba
+from settings import load_settings
+
+# Equivalence test for incremental runs.
+#
+# For each delta, a run on the earlier inputs saves its state and a second
+# run on the current inputs reuses it; its matched and unmatched rows must be
+# the ones a run from scratch on the current inputs gives. Rows are compared
+# by their source row, since an incremental run keeps the ids of the
+# earlier run.
+DELTAS = ['appended rows', 'policy-matched partner', 'removed and changed rows']
+
+# Rows added, removed or changed by each delta
+DELTA_ROWS = 30
+
+
+def write_inputs(directory, name, saiba, lombard):
+    saiba_path = os.path.join(directory, f'{name}_Saiba.xlsx')
+    lombard_path = os.path.join(directory, f'{name}_Lombard.xlsx')
+    saiba.to_excel(saiba_path, index=False)
+    with pd.ExcelWriter(lombard_path) as writer:
+        lombard.to_excel(writer, sheet_name=LOMBARD_READ_OPTIONS['sheet_name'], index=False)
+    return saiba_path, lombard_path
+
+# (earlier Saiba, earlier Lombard, current Saiba, current Lombard) of a delta
+def delta_inputs(delta, saiba, lombard, policy_rows):
+    if delta == 'appended rows':
+        return saiba, lombard.iloc[:-DELTA_ROWS], saiba, lombard
+    if delta == 'policy-matched partner':
+        # Copies of Lombard rows matched by policy number, under another policy
+        # number: their customer matches are already matched by policy number
+        copies = lombard.iloc[policy_rows[:DELTA_ROWS]].copy()
+        copies['POL_NUM_TXT'] = [f'NEW/{row}' for row in range(len(copies))]
+        return saiba, lombard, saiba, pd.concat([lombard, copies], ignore_index=True)
+    if delta == 'removed and changed rows':
+        # Drop rows from both sides, partners of later rows among them, and rename a few customers
+        current = saiba.drop(index=saiba.index[::len(saiba) // DELTA_ROWS]).reset_index(drop=True)
+        current.loc[current.index[:DELTA_ROWS:3], 'CustName'] = 'RENAMED CUSTOMER'
+        return saiba, lombard, current, lombard.drop(index=lombard.index[policy_rows[::2]]).reset_index(drop=True)
+    raise ValueError(f"Unknown delta: {delta}")
+
+# Matched and unmatched rows of both sides, with every id replaced by the source row it stands for
+def by_source_row(mdata1, mdata2, data1, data2):
+    rows1 = pd.concat([mdata1['Index'], data1['Index']])
+    rows2 = pd.concat([mdata2['Index'], data2['Index']])
+    row_of1 = dict(zip(rows1, rows1.index))
+    row_of2 = dict(zip(rows2, rows2.index))
+
+    def relabel(df, own_rows, partner_rows):
+        df = df.copy()
+        df['Index'] = df['Index'].map(own_rows)
+        if 'Matching_Index' in df.columns:
+            df['Matching_Index'] = [', '.join(str(partner_rows[int(partner)]) for partner in partners.split(', '))
+                                    for partners in df['Matching_Index']]
+        return df.sort_values('Index').reset_index(drop=True)
+
+    return [relabel(mdata1, row_of1, row_of2), relabel(mdata2, row_of2, row_of1),
+            relabel(data1, row_of1, row_of2), relabel(data2, row_of2, row_of1)]
+
+def compare(full, incremental):
+    for name, expected, actual in zip(['matched Saiba', 'matched Lombard', 'unmatched Saiba', 'unmatched Lombard'],
+                                      full, incremental):
+        try:
+            # Text columns may come back as object or str; they are written out the same
+            pd.testing.assert_frame_equal(expected, actual, check_dtype=False)
+        except AssertionError as error:
+            return f"{name} rows differ: {str(error).splitlines()[0:3]}"
+    return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that incremental runs give the matches of a run from scratch")
+    parser.add_argument('--saiba', default=os.path.join(ROOT, 'Saiba_Dump.xls'))
+    parser.add_argument('--lombard', default=os.path.join(ROOT, 'Lombard_Statement.xlsx'))
+    args = parser.parse_args()
+
+    saiba = read_saiba(args.saiba)
+    lombard = read_lombard(args.lombard)
+
+    directory = tempfile.mkdtemp()
+    os.chdir(directory)
+    # Default settings, with the shared files in the temporary directory
+    settings = load_settings()
+
+    # Lombard rows the first stage matches by policy number on the full inputs
+    full_run = dict(settings, incremental_state=None)
+    _, mdata2, _, _ = runner.run_pipeline(*write_inputs(directory, 'full', saiba, lombard), full_run)
+    policy_rows = sorted(mdata2.index[mdata2['Matching_Attribute'].isin(['PolicyNo', 'EndoNo'])])
+
+    failed = False
+    for number, delta in enumerate(DELTAS):
+        earlier_saiba, earlier_lombard, current_saiba, current_lombard = delta_inputs(delta, saiba, lombard, policy_rows)
+        earlier_paths = write_inputs(directory, 'earlier', earlier_saiba, earlier_lombard)
+        current_paths = write_inputs(directory, 'current', current_saiba, current_lombard)
+
+        full = by_source_row(*runner.run_pipeline(*current_paths, full_run))
+        incremental_run = dict(settings, incremental_state=f'Reconciliation_State_{number}')
+        runner.run_pipeline(*earlier_paths, incremental_run)
+        incremental = by_source_row(*runner.run_pipeline(*current_paths, incremental_run))
+
+        difference = compare(full, incremental)
+        failed = failed or difference is not None
+        print(f"{delta:26} {difference or 'same'}")
+
+    os.chdir(ROOT)
+    shutil.rmtree(directory)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,63 @@
+import os
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import name_normalizer
+from name_normalizer import normalize_name, preprocess_name
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# The customer-name normalizer as it was copied into each customer stage
+def legacy_preprocess_name(name):
+    if pd.isna(name):
+        return ""
+    name = str(name)
+    words_to_omit = [
+        'industry', 'industries', 'corp', 'corporation', 'inc', 'incorporated', 'foundation',
+        'company', 'co', 'limited', 'ltd', 'pvt', 'llc', 'llp', 'and', 'pvtltd', '&', 'm/s', 'ms'
+    ]
+    name = re.sub(r'\b(Mr|Ms|Ltd|LLP|Pvt|Private|Limited|LLC|LTD|Llp|ltd|lp|PLLP|Pllp|P.L.C.|ms|m/s|pvtltd)\b', '', name, flags=re.IGNORECASE)
+    name = re.sub(r'\b(and|AND|And|&)\b', 'and', name, flags=re.IGNORECASE)
+    name = re.sub(r'[.,]', '', name)
+    for word in words_to_omit:
+        name = re.sub(r'\b' + word + r'\b', '', name, flags=re.IGNORECASE)
+    name = re.sub(r'\s+', '', name).lower()
+    return name
+
+def load_sample_names():
+    saiba = pd.read_excel(os.path.join(REPO_DIR, 'Saiba_Dump.xls'), engine='xlrd')
+    lombard = pd.read_excel(os.path.join(REPO_DIR, 'Lombard_Statement.xlsx'), sheet_name='RAW STATEMENT')
+    return list(saiba['CustName']) + list(lombard['INSURED_CUSTOMER_NAME'])
+
+def names_per_second(func, names, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for name in names:
+            func(name)
+    return repeat * len(names) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    names = load_sample_names()
+    # Every stage sees the same customers again, so repeat the sample a few times
+    repeat = 20
+
+    mismatches = [name for name in names if legacy_preprocess_name(name) != preprocess_name(name)]
+    print(f"{len(names)} sample names, {len(mismatches)} normalized differently")
+
+    legacy_rate = names_per_second(legacy_preprocess_name, names, repeat)
+    compiled_rate = names_per_second(lambda name: "" if pd.isna(name) else normalize_name(str(name)), names, repeat)
+    name_normalizer.cached_normalize_name.cache_clear()
+    name_normalizer.loaded_names.clear()
+    name_normalizer.used_names.clear()
+    cached_rate = names_per_second(preprocess_name, names, repeat)
+
+    print(f"legacy re.sub loop:       {legacy_rate:12,.0f} names/s")
+    print(f"compiled patterns:        {compiled_rate:12,.0f} names/s ({compiled_rate / legacy_rate:.1f}x)")
+    print(f"compiled + cached:        {cached_rate:12,.0f} names/s ({cached_rate / legacy_rate:.1f}x)")
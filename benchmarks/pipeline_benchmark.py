@@ -0,0 +1,130 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from Lombard_Saiba_Code import load_script, scripts
+from input_loading import add_index
+from instrumentation import PeakMemory
+from match_planner import DateRange, PremiumRange
+from name_matching import SCORER_BACKENDS, compute_similarity
+from name_normalizer import cached_normalize_name
+from output_export import export_outputs
+from settings import load_settings
+from synthetic_data import generate_pair, write_pair
+from workbook_io import load_working_data
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Scaling benchmark on synthetic inputs (see synthetic_data.py).
+#
+# For each size every stage is timed on its own, and the results are written
+# to a JSON file (one record per size and stage: seconds, input rows per
+# second and peak RSS) so runs on two versions can be compared.
+def timed(results, rows, stage, input_rows, function, *args):
+    with PeakMemory() as memory:
+        start = time.perf_counter()
+        value = function(*args)
+        seconds = time.perf_counter() - start
+    results.append({
+        'rows': rows,
+        'stage': stage,
+        'input_rows': input_rows,
+        'seconds': round(seconds, 4),
+        'rows_per_second': round(input_rows / seconds, 1) if seconds else None,
+        'peak_rss_mb': round(memory.peak / 2 ** 20, 1),
+    })
+    print(f"{rows:>9} {stage:32} {seconds:9.3f}s {results[-1]['rows_per_second'] or 0:>12,.0f} rows/s "
+          f"{results[-1]['peak_rss_mb']:>8} MB")
+    return value
+
+def similarity(data1, data2, backend, workers):
+    # Start from an empty name cache so every backend normalizes the names itself
+    cached_normalize_name.cache_clear()
+    return compute_similarity(data1, data2, 71, workers, backend)
+
+def tenure_join(data1, data2):
+    pairs = DateRange('start_date', 'Policy_StartDate', 'POLICY_START_DATE').join(data1, data2)
+    return DateRange('end_date', 'Exp. Date', 'POLICY_END_DATE').filter(data1, data2, pairs)
+
+def benchmark_size(rows, seed, excel, workers, results):
+    policy_stage, customer_policy_stage, customer_tenure_stage = [load_script(script) for script, _ in scripts]
+    settings = load_settings()
+    saiba, lombard = generate_pair(rows, seed)
+    total = 2 * rows
+
+    if excel:
+        saiba_path, lombard_path = write_pair(saiba, lombard, '.', rows)
+        timed(results, rows, 'process_excel_files', total, policy_stage.process_excel_files, saiba_path, lombard_path)
+        mdata1, mdata2 = load_working_data('Matched_Data')
+        data1, data2 = load_working_data('Unmatched_Data')
+    else:
+        data1, data2 = add_index(saiba), add_index(lombard)
+        mdata1, mdata2, data1, data2 = timed(results, rows, 'match_policy_numbers', total,
+                                             policy_stage.match_policy_numbers, data1, data2)
+
+    unmatched = len(data1) + len(data2)
+    for backend in SCORER_BACKENDS:
+        timed(results, rows, f'compute_similarity[{backend}]', unmatched, similarity, data1, data2, backend, workers)
+
+    # The premium and date joins the customer stages start their rules with
+    timed(results, rows, 'premium_join', unmatched, PremiumRange('OD Premium', 'APPLICABLE_PREMIUM_AMOUNT').join,
+          data1, data2)
+    timed(results, rows, 'tenure_join', unmatched, tenure_join, data1, data2)
+
+    mdata1, mdata2, data1, data2 = timed(results, rows, 'match_customer_policy_premium', unmatched,
+                                         customer_policy_stage.match_customer_policy_premium, mdata1, mdata2, data1, data2,
+                                         settings)
+    mdata1, mdata2, data1, data2 = timed(results, rows, 'match_customer_premium_tenure', len(data1) + len(data2),
+                                         customer_tenure_stage.match_customer_premium_tenure, mdata1, mdata2, data1, data2,
+                                         settings)
+
+    outputs = {'Matched_Data': (mdata1, mdata2), 'Unmatched_Data': (data1, data2)}
+    timed(results, rows, 'export[parquet]', total, export_outputs, outputs, ['parquet'])
+    if excel:
+        timed(results, rows, 'export[xlsx]', total, export_outputs, outputs, ['xlsx'])
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time every stage on synthetic Saiba/Lombard inputs")
+    parser.add_argument('rows', type=int, nargs='*', default=[1000, 10000], help="rows per input file")
+    parser.add_argument('--output', default='benchmark_results.json', help="JSON file for the results")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=1, help="name scoring processes (0 = every core)")
+    parser.add_argument('--no-excel', dest='excel', action='store_false',
+                        help="skip writing and reading Excel files (for the largest sizes)")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+
+    results = []
+    # Stage scripts write working files and the compatibility table to the current directory
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        for rows in args.rows:
+            benchmark_size(rows, args.seed, args.excel, args.workers, results)
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump({
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': args.seed,
+            'results': results,
+        }, f, indent=2)
+    print(f"Wrote {output}")
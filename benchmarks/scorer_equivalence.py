@@ -0,0 +1,64 @@
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzywuzzy import fuzz
+
+from name_matching import SCORER_BACKENDS
+from name_normalizer import preprocess_name
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Equivalence test for the customer-name scorer backends.
+#
+# Every backend must return the same (i, j, score) matches as the default
+# 'fuzzywuzzy' backend at the matching threshold. The 'rapidfuzz' backend is
+# exact when fuzzywuzzy runs on python-Levenshtein. On the pure-python difflib
+# fallback, fuzzywuzzy can score a pair a little lower, so rapidfuzz may
+# return extra matches; those are listed instead of failing the check.
+def load_sample_names():
+    saiba = pd.read_excel(os.path.join(REPO_DIR, 'Saiba_Dump.xls'), engine='xlrd')
+    lombard = pd.read_excel(os.path.join(REPO_DIR, 'Lombard_Statement.xlsx'), sheet_name='RAW STATEMENT')
+    names1 = pd.Series(saiba['CustName'].unique()).astype(str).apply(preprocess_name).tolist()
+    names2 = pd.Series(lombard['INSURED_CUSTOMER_NAME'].unique()).astype(str).apply(preprocess_name).tolist()
+    return names1, names2
+
+def uses_levenshtein():
+    return fuzz.SequenceMatcher.__module__ != 'difflib'
+
+
+if __name__ == "__main__":
+    threshold = 71
+    names1, names2 = load_sample_names()
+    print(f"{len(names1)} x {len(names2)} names, fuzzywuzzy on {'python-Levenshtein' if uses_levenshtein() else 'difflib'}")
+
+    results = {}
+    for backend, score_name_pairs in SCORER_BACKENDS.items():
+        start = time.perf_counter()
+        matches, stats = score_name_pairs(names1, names2, threshold, 1)
+        results[backend] = matches
+        print(f"{backend:12} {len(matches):6} matches in {time.perf_counter() - start:.3f}s")
+
+    reference = {(i, j): score for i, j, score in results['fuzzywuzzy']}
+    failed = False
+    for backend, matches in results.items():
+        if backend == 'fuzzywuzzy':
+            continue
+        scores = {(i, j): score for i, j, score in matches}
+        missing = reference.keys() - scores.keys()
+        extra = scores.keys() - reference.keys()
+        changed = {pair for pair in reference.keys() & scores.keys() if reference[pair] != scores[pair]}
+        for i, j in sorted(extra | changed):
+            print(f"  {backend}: {names1[i]!r} ~ {names2[j]!r} scores {scores[i, j]}, fuzz.ratio {fuzz.ratio(names1[i], names2[j])}")
+        if missing or ((extra or changed) and uses_levenshtein()):
+            failed = True
+        if missing or extra or changed:
+            print(f"{backend}: {len(missing)} missing, {len(extra)} extra, {len(changed)} rescored matches")
+        else:
+            print(f"{backend}: equivalent")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,183 @@
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from input_loading import LOMBARD_READ_OPTIONS
+from workbook_io import write_table
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Synthetic Saiba dump / Lombard statement pairs with the column layout of the
+# sample files. Each Saiba row gets a Lombard counterpart that one of the
+# stages should find, or none:
+#   policy       POL_NUM_TXT is the Saiba PolicyNo, written with other separators
+#   endorsement  POL_NUM_TXT is the Saiba EndoNo
+#   customer     same customer under a noisy name, compatible product, premium within 2%
+#   tenure       same customer and premium, product named differently, same dates
+#   unmatched    no counterpart; the Lombard row belongs to another customer
+# Name noise ('M/S', 'PVT LTD' vs 'PRIVATE LIMITED', typos), premium drift,
+# date offsets and endorsement numbers also appear on rows that must not match.
+CATEGORIES = ['policy', 'endorsement', 'customer', 'tenure', 'unmatched']
+CATEGORY_WEIGHTS = [0.50, 0.10, 0.20, 0.08, 0.12]
+
+NAME_WORDS = [
+    'TECHNO', 'ELECTRIC', 'WEST', 'COAST', 'PAPER', 'MILLS', 'SHREE', 'BALAJI', 'INFRA', 'STEEL',
+    'AGRO', 'CEMENT', 'POWER', 'TEXTILES', 'GANGA', 'SATYA', 'BUILDERS', 'ROADWAYS', 'LOGISTICS', 'PHARMA',
+    'CHEMICALS', 'FOODS', 'MOTORS', 'EXPORTS', 'ENTERPRISES', 'TRADERS', 'INDUSTRIES', 'SOLAR', 'SUGAR', 'JUTE',
+    'TEA', 'HOTELS', 'PLASTICS', 'PACKAGING', 'GLASS', 'METALS', 'CABLES', 'ENERGY', 'HOSPITAL', 'ESTATES',
+]
+# Company suffix as written in Saiba and in the Lombard statement
+NAME_SUFFIXES = [('PVT LTD', 'PRIVATE LIMITED'), ('PVT. LTD.', 'PVT LTD'), ('LTD', 'LIMITED'),
+                 ('& CO.', 'AND COMPANY'), ('LLP', 'LLP'), ('', '')]
+
+# Saiba 'Policy Type', a Lombard 'PRODUCT_NAME' the policy type check accepts,
+# one it rejects, and the product code
+PRODUCTS = [
+    ('ERECTION ALL RISK', 'ERECTION ALL RISKS', 'EAR', 2005),
+    ('GROUP MEDICLAIM', 'GROUP MEDICLAIM POLICY', 'GROUP HEALTH', 2801),
+    ('BHARAT LAGHU UDYAM SURAKSHA', 'ICICI BHARAT LAGHU UDYAM SURAKSHA', 'BLUS', 1016),
+    ('BHARAT GRIHA RAKSHA', 'BHARAT GRIHA RAKSHA POLICY', 'HOME', 1017),
+    ('MARINE CARGO', 'MARINE CARGO OPEN', 'MARINE', 2001),
+    ('BURGLARY INSURANCE', 'BURGLARY INSURANCES', 'BURGLARY', 4001),
+    ('WORKMENS COMPENSATION', 'WORKMANS COMPENSATION', 'WC', 4002),
+    ('PRIVATE CAR PACKAGE', 'PRIVATE CAR PACKAGE POLICY', 'PRIVATE CAR', 3001),
+    ('Passenger Carring Vehicle', 'PASSENGER CARRYING VEHICLE', 'PCV', 3005),
+    ('STANDARD FIRE & SPECIAL PERILS', 'STANDARD FIRE & SPECIAL PERILS POLICY', 'FIRE', 1012),
+]
+
+FIRST_START_DATE = np.datetime64('2023-04-01')
+
+
+def read_schemas():
+    # Column names of the sample files, in order
+    saiba = pd.read_excel(os.path.join(REPO_DIR, 'Saiba_Dump.xls'), nrows=0)
+    lombard = pd.read_excel(os.path.join(REPO_DIR, 'Lombard_Statement.xlsx'), nrows=0, **LOMBARD_READ_OPTIONS)
+    return list(saiba.columns), list(lombard.columns)
+
+def customer_names(rng, count):
+    initials = rng.integers(0, 26, size=(count, 2)) + ord('A')
+    words = rng.integers(0, len(NAME_WORDS), size=(count, 2))
+    return [f"{chr(a)}.{chr(b)}. {NAME_WORDS[w1]} {NAME_WORDS[w2]}" for (a, b), (w1, w2) in zip(initials, words)]
+
+def typo(rng, name):
+    # Drop or swap one character
+    i = int(rng.integers(1, len(name) - 1))
+    if rng.random() < 0.5:
+        return name[:i] + name[i + 1:]
+    return name[:i - 1] + name[i] + name[i - 1] + name[i + 1:]
+
+def noisy_names(rng, names, suffixes, prefix_rate, typo_rate):
+    noisy = []
+    for name, suffix, prefix, misspelt in zip(names, suffixes, rng.random(len(names)) < prefix_rate,
+                                              rng.random(len(names)) < typo_rate):
+        name = typo(rng, name) if misspelt else name
+        noisy.append(('M/S ' if prefix else '') + (f"{name} {suffix}" if suffix else name))
+    return noisy
+
+def frame_with_schema(columns, values, rows):
+    df = pd.DataFrame(values)
+    for col in columns:
+        if col not in df.columns:
+            df[col] = np.nan
+    return df[columns].iloc[:rows]
+
+def generate_pair(rows, seed=0):
+    rng = np.random.default_rng(seed)
+    saiba_columns, lombard_columns = read_schemas()
+
+    category = rng.choice(len(CATEGORIES), size=rows, p=CATEGORY_WEIGHTS)
+    is_category = {name: category == i for i, name in enumerate(CATEGORIES)}
+
+    # A few policies per customer, so the name scorer sees realistic blocks
+    customers = customer_names(rng, max(10, rows // 4))
+    customer = rng.integers(0, len(customers), size=rows)
+    other_customer = rng.integers(0, len(customers), size=rows)
+    suffix = rng.integers(0, len(NAME_SUFFIXES), size=rows)
+    product = rng.integers(0, len(PRODUCTS), size=rows)
+
+    policy_serial = rng.permutation(10 ** 8)[:rows] + 10 ** 8
+    codes = np.array([code for *_, code in PRODUCTS])[product]
+    policy_numbers = [f"{code}/{serial}/00/000" for code, serial in zip(codes, policy_serial)]
+    endorsement_numbers = [f"{code}/{serial}/00/{int(n):03d}" for code, serial, n in
+                           zip(codes, policy_serial, rng.integers(1, 20, size=rows))]
+
+    premium = np.round(np.exp(rng.normal(10, 1.5, size=rows)), 2)
+    start = FIRST_START_DATE + rng.integers(0, 365, size=rows).astype('timedelta64[D]')
+    end = start + np.timedelta64(364, 'D')
+
+    # Saiba rows
+    saiba_names = noisy_names(rng, [customers[c] for c in customer], [NAME_SUFFIXES[s][0] for s in suffix], 0.15, 0.0)
+    saiba = frame_with_schema(saiba_columns, {
+        'PolicyNo': policy_numbers,
+        'EndoNo': np.where(is_category['endorsement'], endorsement_numbers, '0'),
+        'CustName': saiba_names,
+        'Insurer': 'ICICI LOMBARD GENERAL INSURANCE CO. LTD.',
+        'Policy Type': [PRODUCTS[p][0] for p in product],
+        'Policy_StartDate': start,
+        'Exp. Date': end,
+        'OD Premium': premium,
+    }, rows)
+
+    # Lombard rows, one per Saiba row
+    drift = np.where(is_category['customer'], rng.uniform(-0.02, 0.02, size=rows), 0)
+    drift = np.where(is_category['unmatched'], rng.uniform(-0.3, 0.3, size=rows), drift)
+    offset = np.where(is_category['customer'] & (rng.random(rows) < 0.3), rng.integers(-3, 4, size=rows), 0)
+    lombard_customer = np.where(is_category['unmatched'], other_customer, customer)
+    lombard_names = noisy_names(rng, [customers[c] for c in lombard_customer], [NAME_SUFFIXES[s][1] for s in suffix], 0.0, 0.1)
+    lombard_policy_numbers = np.where(is_category['policy'], [number.replace('/', '-') for number in policy_numbers],
+                                      np.where(is_category['endorsement'], endorsement_numbers,
+                                               [f"{code}/{serial + 1}/01/000" for code, serial in zip(codes, policy_serial)]))
+    lombard = frame_with_schema(lombard_columns, {
+        'AGENT_CATEGORY_NAME': 'BROKER',
+        'INTERMEDIARY_NAME': 'SALASAR SERVICES INSURANCE BROKERS PVT LTD',
+        'INSURED_CUSTOMER_NAME': lombard_names,
+        'PRODUCT_CODE': codes,
+        'PRODUCT_NAME': [PRODUCTS[p][2] if c == 'tenure' else PRODUCTS[p][1]
+                         for p, c in zip(product, np.array(CATEGORIES)[category])],
+        'POLICY_NUMBER': [number.rsplit('/', 1)[0] for number in lombard_policy_numbers],
+        'POL_NUM_TXT': lombard_policy_numbers,
+        'APPLICABLE_PREMIUM_AMOUNT': np.round(premium * (1 + drift), 2),
+        'POLICY_START_DATE': start + offset.astype('timedelta64[D]'),
+        'POLICY_END_DATE': end + offset.astype('timedelta64[D]'),
+        'ENDORSEMENT_NUMBER': 0,
+    }, rows)
+    lombard = lombard.iloc[rng.permutation(rows)].reset_index(drop=True)
+    return saiba, lombard
+
+def write_pair(saiba, lombard, directory, rows, file_format='xlsx'):
+    # Excel files in the input layout, or Feather files in the working-data layout
+    os.makedirs(directory, exist_ok=True)
+    if file_format == 'xlsx':
+        saiba_path = os.path.join(directory, f'Saiba_Dump_{rows}.xlsx')
+        lombard_path = os.path.join(directory, f'Lombard_Statement_{rows}.xlsx')
+        saiba.to_excel(saiba_path, index=False)
+        with pd.ExcelWriter(lombard_path) as writer:
+            lombard.to_excel(writer, sheet_name=LOMBARD_READ_OPTIONS['sheet_name'], index=False)
+    elif file_format == 'feather':
+        saiba_path = os.path.join(directory, f'Saiba_Dump_{rows}.feather')
+        lombard_path = os.path.join(directory, f'Lombard_Statement_{rows}.feather')
+        write_table(saiba_path, saiba)
+        write_table(lombard_path, lombard)
+    else:
+        raise ValueError(f"Unknown file format: {file_format}")
+    return saiba_path, lombard_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic Saiba/Lombard input pairs")
+    parser.add_argument('rows', type=int, nargs='+', help="rows per file, e.g. 1000 100000 1000000")
+    parser.add_argument('--output-dir', default='synthetic_data')
+    parser.add_argument('--format', choices=['xlsx', 'feather'], default='xlsx')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    for rows in args.rows:
+        saiba, lombard = generate_pair(rows, args.seed)
+        for path in write_pair(saiba, lombard, args.output_dir, rows, args.format):
+            print(f"Wrote {path}")
@@ -0,0 +1,210 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import note
+from match_annotation import annotate_matches
+from workbook_io import SAIBA_SHEET, load_working_data, save_working_data, working_path
+
+# A source row is identified by the hash of its content and, for rows that
+# appear more than once, by how many identical rows came before it
+ROW_KEY = ['Fingerprint', 'Occurrence']
+
+# Columns kept per row in the saved state: the partners of the row, the
+# attribute of each partner and the stage (0, 1, ...) that matched it
+STATE_COLUMNS = ['Index'] + ROW_KEY + ['Matching_Index', 'Matching_Attribute', 'Matching_Stage']
+
+# Matching_Stage of rows no stage matched, and of rows whose stage the saved state does not tell
+UNMATCHED = -1
+UNKNOWN = -2
+
+# Attributes the customer stages give a whole row rather than each partner
+ROW_ATTRIBUTES = {'Customer+Policy+Premium', 'Customer+Premium+Tenure'}
+
+
+# #### Row identities
+
+def row_fingerprints(data):
+    fingerprints = pd.util.hash_pandas_object(data.drop(columns='Index', errors='ignore'), index=False).to_numpy()
+    occurrence = pd.Series(fingerprints).groupby(fingerprints).cumcount().to_numpy()
+    return pd.DataFrame({'Fingerprint': fingerprints, 'Occurrence': occurrence})
+
+# Give every row its id from the previous run, and new or changed rows
+# fresh ids after the highest id used so far
+def assign_row_ids(data, state):
+    ids = row_fingerprints(data)
+    ids = ids.merge(state[['Index'] + ROW_KEY], on=ROW_KEY, how='left')
+    new = ids['Index'].isna().to_numpy()
+    start = int(state['Index'].max()) + 1 if len(state) else 1
+    ids.loc[new, 'Index'] = np.arange(start, start + int(new.sum()))
+    ids['Index'] = ids['Index'].astype(np.int64)
+
+    # The frame index (the source row number) is kept
+    data = data.drop(columns='Index', errors='ignore')
+    data.insert(0, 'Index', ids['Index'].to_numpy())
+    order = np.argsort(data['Index'].to_numpy(), kind='stable')
+    return data.iloc[order], ids.iloc[order].reset_index(drop=True)
+
+
+# #### Saved state
+
+def empty_state():
+    return pd.DataFrame({'Index': pd.Series(dtype=np.int64), 'Fingerprint': pd.Series(dtype=np.uint64),
+                         'Occurrence': pd.Series(dtype=np.int64), 'Matching_Index': pd.Series(dtype=object),
+                         'Matching_Attribute': pd.Series(dtype=object), 'Matching_Stage': pd.Series(dtype=np.int64)})
+
+def load_state(name):
+    if not os.path.exists(working_path(name, SAIBA_SHEET)):
+        return empty_state(), empty_state()
+    return tuple(matching_stages(integer_row_ids(state)) for state in load_working_data(name, memory_map=False))
+
+# States saved before rows had integer ids hold labels like 'S12' and 'L3, L7'
+def integer_row_ids(state):
+    if state['Index'].dtype.kind in 'iu':
+        return state
+    state = state.copy()
+    state['Index'] = state['Index'].str[1:].astype(np.int64)
+    state['Matching_Index'] = state['Matching_Index'].str.replace(r'[SL]', '', regex=True)
+    return state
+
+# States saved before the stage of each match was kept: the rows keep their
+# ids, but every row is matched again
+def matching_stages(state):
+    if 'Matching_Stage' in state.columns:
+        return state
+    state = state.copy()
+    state['Matching_Index'] = state['Matching_Attribute'] = None
+    state['Matching_Stage'] = UNKNOWN
+    return state[STATE_COLUMNS]
+
+# One attribute per partner, also for the rows of the customer stages
+def partner_attributes(matching_index, matching_attribute):
+    if matching_attribute in ROW_ATTRIBUTES:
+        return ', '.join([matching_attribute] * len(matching_index.split(', ')))
+    return matching_attribute
+
+# The Matching_Attribute a stage writes for a row, from the attributes of its partners
+def row_attribute(attributes):
+    first = attributes.split(', ')[0]
+    return first if first in ROW_ATTRIBUTES else attributes
+
+# Ids, fingerprints and matches of every row in this run
+def build_state(ids, matched, stages):
+    state = ids[['Index'] + ROW_KEY].copy()
+    matching = matched.set_index('Index')
+    attributes = pd.Series([partner_attributes(matching_index, attribute) for matching_index, attribute
+                            in zip(matching['Matching_Index'], matching['Matching_Attribute'])],
+                           index=matching.index, dtype=object)
+    state['Matching_Index'] = state['Index'].map(matching['Matching_Index'])
+    state['Matching_Attribute'] = state['Index'].map(attributes)
+    state['Matching_Stage'] = state['Index'].map(stages).fillna(UNMATCHED).astype(np.int64)
+    return state[STATE_COLUMNS]
+
+def save_state(name, ids1, ids2, mdata1, mdata2, stages1, stages2):
+    save_working_data(name, build_state(ids1, mdata1, stages1), build_state(ids2, mdata2, stages2))
+
+
+# #### Reusing earlier results
+
+# A stage decides every pair of rows on its own, so a row's partners at a
+# stage depend only on the row and on the rows of the other side still
+# unmatched at that stage. The result of the previous run is reused for a
+# row when it was compared there with the same rows:
+#   unknown  rows that are new or changed, or that an earlier stage matched
+#            last time but not now; they are matched against every row
+#   redone   rows that gain an unknown partner or lost a partner since; their
+#            partners are found again against every row
+#   others   keep their partners (or having none) from the previous run
+# This gives the same matches as a run from scratch while only comparing rows
+# with unknown rows, and the few redone rows with everything.
+
+# Rows of one side whose result at this stage the previous run does not tell
+def unknown_rows(data, state, number):
+    previous = data['Index'].map(state.set_index('Index')['Matching_Stage'])
+    return ~(previous.eq(UNMATCHED) | previous.ge(number)).to_numpy()
+
+def partner_ids(matched):
+    return {int(partner) for partners in matched['Matching_Index'] for partner in partners.split(', ')}
+
+# Partners the previous run found at this stage for rows of data, and the
+# rows whose partners are no longer all among the known rows of the other side
+def earlier_matches(data, state, number, known_partners):
+    earlier = state[(state['Matching_Stage'] == number) & state['Index'].isin(data['Index'])]
+    lost = [row_id for row_id, partners in zip(earlier['Index'], earlier['Matching_Index'])
+            if any(int(partner) not in known_partners for partner in partners.split(', '))]
+    return earlier, set(lost)
+
+# Rows of data with their earlier partners, as the stage writes them
+def with_earlier_matches(data, earlier):
+    earlier = earlier.set_index('Index')
+    rows = data[data['Index'].isin(earlier.index)].copy()
+    rows.insert(1, 'Matching_Index', rows['Index'].map(earlier['Matching_Index']).to_numpy(dtype=object))
+    rows.insert(2, 'Matching_Attribute', [row_attribute(attributes) for attributes
+                                          in rows['Index'].map(earlier['Matching_Attribute'])])
+    return rows
+
+def sort_by_index(df):
+    return df.sort_values('Index', kind='stable')
+
+def run_pass(run_stage, number, data1, data2):
+    if not len(data1) or not len(data2):
+        return annotate_matches(data1.iloc[:0], data2.iloc[:0], [], [], '', '')
+    return run_stage(number, data1, data2)
+
+def match_stage(run_stage, number, data1, data2, state1, state2, pairwise):
+    unknown1 = unknown_rows(data1, state1, number)
+    unknown2 = unknown_rows(data2, state2, number)
+    if not pairwise or unknown1.all() or unknown2.all():
+        return run_pass(run_stage, number, data1, data2)
+    ids1, ids2 = data1['Index'], data2['Index']
+    earlier1, lost1 = earlier_matches(data1, state1, number, set(ids2[~unknown2]))
+    earlier2, lost2 = earlier_matches(data2, state2, number, set(ids1[~unknown1]))
+
+    # Unknown Saiba rows against every Lombard row
+    new1, new2 = run_pass(run_stage, number, data1[unknown1], data2)
+    # Unknown and redone Lombard rows against every Saiba row
+    redo2 = unknown2 | ids2.isin(set(new2['Index']) | lost2).to_numpy()
+    _, matched2 = run_pass(run_stage, number, data1, data2[redo2])
+    # Redone Saiba rows against every Lombard row
+    gained1 = partner_ids(matched2[matched2['Index'].isin(ids2[unknown2])])
+    redo1 = ~unknown1 & ids1.isin(gained1 | lost1).to_numpy()
+    redone1, _ = run_pass(run_stage, number, data1[redo1], data2)
+
+    matched1 = pd.concat([new1, redone1, with_earlier_matches(data1[~unknown1 & ~redo1], earlier1)])
+    matched2 = pd.concat([matched2, with_earlier_matches(data2[~redo2], earlier2)])
+    return sort_by_index(matched1), sort_by_index(matched2)
+
+
+# #### Incremental run
+
+# Reconcile against the state saved by the previous run. The stages run in
+# order on the old and new rows, as in a run from scratch, but rows compared
+# with each other last time are not compared again (see match_stage). With
+# pairwise False (a pair assignment other than 'all', where a row's partners
+# depend on its neighbours' other candidates) every stage runs in full.
+def reconcile_incrementally(broker_data, company_data, run_stage, stage_count, name, pairwise=True):
+    state1, state2 = load_state(name)
+    broker_data, ids1 = assign_row_ids(broker_data, state1)
+    company_data, ids2 = assign_row_ids(company_data, state2)
+    new1 = int(unknown_rows(broker_data, state1, 0).sum())
+    new2 = int(unknown_rows(company_data, state2, 0).sum())
+    note(new_saiba_rows=new1, new_lombard_rows=new2,
+         reused_saiba_rows=len(broker_data) - new1, reused_lombard_rows=len(company_data) - new2)
+
+    # The stages see the rows in source order, as in a run from scratch
+    data1, data2 = broker_data.sort_index(), company_data.sort_index()
+    mdata1, mdata2, stages1, stages2 = [], [], [], []
+    for number in range(stage_count):
+        matched1, matched2 = match_stage(run_stage, number, data1, data2, state1, state2, pairwise)
+        mdata1.append(matched1)
+        mdata2.append(matched2)
+        stages1.append(pd.Series(number, index=matched1['Index'].to_numpy()))
+        stages2.append(pd.Series(number, index=matched2['Index'].to_numpy()))
+        data1 = data1[~data1['Index'].isin(matched1['Index'])]
+        data2 = data2[~data2['Index'].isin(matched2['Index'])]
+    mdata1 = sort_by_index(pd.concat(mdata1))
+    mdata2 = sort_by_index(pd.concat(mdata2))
+
+    save_state(name, ids1, ids2, mdata1, mdata2, pd.concat(stages1), pd.concat(stages2))
+    return broker_data, company_data, mdata1, mdata2, data1, data2
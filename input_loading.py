@@ -0,0 +1,177 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import note
+
+# How each input is read
+SAIBA_READ_OPTIONS = {}
+LOMBARD_READ_OPTIONS = {'sheet_name': 'RAW STATEMENT'}
+
+# Columns the matching stages use, with the dtype each is read as. Policy
+# numbers stay object so numbers and text both reach canonical_policy_number.
+SAIBA_MATCHING_COLUMNS = {
+    'PolicyNo': object,
+    'EndoNo': object,
+    'CustName': object,
+    'Policy Type': object,
+    'OD Premium': 'float64',
+    'Policy_StartDate': object,
+    'Exp. Date': object,
+}
+LOMBARD_MATCHING_COLUMNS = {
+    'POL_NUM_TXT': object,
+    'INSURED_CUSTOMER_NAME': object,
+    'PRODUCT_NAME': object,
+    'APPLICABLE_PREMIUM_AMOUNT': 'float64',
+    'POLICY_START_DATE': object,
+    'POLICY_END_DATE': object,
+}
+
+# Date columns, parsed once on load the way the tenure check reads them
+SAIBA_DATE_COLUMNS = ['Policy_StartDate', 'Exp. Date']
+LOMBARD_DATE_COLUMNS = ['POLICY_START_DATE', 'POLICY_END_DATE']
+
+# Side tag of each input. Rows are identified by an integer id in 'Index'
+# (1, 2, ...), written with the tag of their side only in the outputs ('S1', 'L1').
+SAIBA_PREFIX = 'S'
+LOMBARD_PREFIX = 'L'
+
+# Low-cardinality columns held as categoricals in the compact representation,
+# when at most CATEGORY_RATIO of their values are distinct
+SAIBA_CATEGORY_COLUMNS = ['Policy Type']
+LOMBARD_CATEGORY_COLUMNS = ['PRODUCT_NAME']
+CATEGORY_RATIO = 0.5
+
+
+def add_index(df):
+    # Add the row id column and make it the first column
+    df = df.copy()
+    df['Index'] = np.arange(1, len(df) + 1, dtype=np.int64)
+    return df[['Index'] + [col for col in df.columns if col != 'Index']]
+
+# Write the row ids of one side, and the partner ids in 'Matching_Index', with their side tags
+def label_rows(df, prefix, partner_prefix):
+    df = df.copy(deep=False)
+    if 'Index' in df.columns:
+        df['Index'] = [prefix + str(row_id) for row_id in df['Index']]
+    if 'Matching_Index' in df.columns:
+        df['Matching_Index'] = [partner_prefix + value.replace(', ', ', ' + partner_prefix) if isinstance(value, str) and value
+                                else value for value in df['Matching_Index']]
+    return df
+
+def render_row_labels(saiba_data, lombard_data):
+    return label_rows(saiba_data, SAIBA_PREFIX, LOMBARD_PREFIX), label_rows(lombard_data, LOMBARD_PREFIX, SAIBA_PREFIX)
+
+# Same columns, order and dtypes as reading with usecols and dtype
+def project_columns(df, columns):
+    return df[[col for col in df.columns if col in columns]].astype(columns)
+
+# A Saiba dump shared by many runs can be read once and passed instead of its path
+def read_saiba(file_path, columns=None):
+    if isinstance(file_path, pd.DataFrame):
+        return file_path.copy() if columns is None else project_columns(file_path, columns)
+    return pd.read_excel(file_path, usecols=columns and list(columns), dtype=columns, **SAIBA_READ_OPTIONS)
+
+def read_lombard(file_path, columns=None):
+    return pd.read_excel(file_path, usecols=columns and list(columns), dtype=columns, **LOMBARD_READ_OPTIONS)
+
+
+# #### Column-projected loading
+
+# Working dataset holding the rows as read while the stages run
+PASSTHROUGH_DATA = 'Passthrough_Data'
+
+def parse_date_columns(df, columns):
+    for col in columns:
+        df[col] = pd.to_datetime(df[col], errors='coerce', dayfirst=True)
+    return df
+
+# Each input is parsed once. The stages get only the columns they match on;
+# the rows as read are spilled to a columnar file (passthrough_path) and
+# loaded again for the outputs. The frame index stays the row number in the
+# source file, which is how the other columns are found again.
+def load_matching_saiba(file_path, passthrough_path):
+    return split_input(read_saiba(file_path), SAIBA_MATCHING_COLUMNS, SAIBA_DATE_COLUMNS, passthrough_path)
+
+def load_matching_lombard(file_path, passthrough_path):
+    return split_input(read_lombard(file_path), LOMBARD_MATCHING_COLUMNS, LOMBARD_DATE_COLUMNS, passthrough_path)
+
+def split_input(df, columns, date_columns, passthrough_path):
+    # workbook_io imports this module, so it is imported here
+    from workbook_io import write_table
+
+    write_table(passthrough_path, df)
+    return add_index(parse_date_columns(project_columns(df, columns), date_columns))
+
+# The rows spilled by load_matching_saiba/load_matching_lombard; the file is removed once read
+def load_passthrough(passthrough_path):
+    from workbook_io import read_table
+
+    df = read_table(passthrough_path, memory_map=False)
+    os.remove(passthrough_path)
+    return df
+
+
+# #### Compact representation
+
+# Every conversion below is lossless, so the stages see the same values in
+# less memory. Outputs are unaffected: they get the source columns back.
+
+def arrow_string_dtype():
+    # Arrow-backed strings with NaN for missing values, if pandas and pyarrow support them
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)
+    except (ImportError, TypeError):
+        return None
+
+def float32_is_exact(values):
+    # Whole-rupee premiums below 2**24 fit float32 exactly; paise usually don't
+    values = values.to_numpy()
+    with np.errstate(over='ignore'):
+        narrow = values.astype(np.float32)
+    return bool(np.array_equal(narrow.astype(np.float64), values, equal_nan=True))
+
+def compact_column(values, categorical):
+    if categorical and values.nunique() <= CATEGORY_RATIO * len(values):
+        return values.astype('category')
+    if values.dtype == np.float64 and float32_is_exact(values):
+        return values.astype(np.float32)
+    if values.dtype == object:
+        # Policy numbers mixing numbers and text stay object for canonical_policy_number
+        string_dtype = arrow_string_dtype()
+        if string_dtype is not None and values.dropna().map(type).eq(str).all():
+            return values.astype(string_dtype)
+    return values
+
+def compact_frame(df, category_columns):
+    df = df.copy()
+    for col in df.columns:
+        if col != 'Index':
+            df[col] = compact_column(df[col], col in category_columns)
+    return df
+
+def frame_megabytes(df):
+    return round(df.memory_usage(deep=True).sum() / 2 ** 20, 3)
+
+# Compact the frames from load_matching_saiba/load_matching_lombard; their memory before and
+# after goes to the run report
+def compact_matching_data(broker_data, company_data):
+    sizes = {}
+    compacted = []
+    for name, df, category_columns in [('saiba', broker_data, SAIBA_CATEGORY_COLUMNS),
+                                       ('lombard', company_data, LOMBARD_CATEGORY_COLUMNS)]:
+        compact = compact_frame(df, category_columns)
+        sizes[f'{name}_mb_before'], sizes[f'{name}_mb_after'] = frame_megabytes(df), frame_megabytes(compact)
+        compacted.append(compact)
+    note(**sizes)
+    return tuple(compacted)
+
+# Replace the matching columns of a stage result with the full source rows,
+# keeping 'Index' and any Matching_Index/Matching_Attribute columns in front
+def attach_passthrough(data, passthrough):
+    leading = [col for col in ['Index', 'Matching_Index', 'Matching_Attribute'] if col in data.columns]
+    rows = passthrough.iloc[data.index.to_numpy()]
+    rows.index = data.index
+    return pd.concat([data[leading], rows], axis=1)
@@ -0,0 +1,129 @@
+import cProfile
+import json
+import os
+import resource
+import sys
+import threading
+import time
+
+# Seconds between RSS samples while a stage runs
+SAMPLE_INTERVAL = 0.01
+
+# Recording is off until start_run is called; stage() and note() then do nothing
+run_report = None
+open_stages = []
+# Stage run under cProfile, and the profile collected over every time it runs
+profiled_stage = None
+profiler = None
+
+
+# #### Memory
+
+def current_rss():
+    # Resident set size in bytes; Linux only, elsewhere the process peak is used
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        return None
+
+def process_peak_rss():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+# Peak RSS while a block runs, sampled from a background thread
+class PeakMemory:
+    def __enter__(self):
+        self.peak = current_rss() or 0
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, current_rss() or 0)
+            time.sleep(SAMPLE_INTERVAL)
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+        rss = current_rss()
+        self.peak = max(self.peak, rss) if rss is not None else process_peak_rss()
+        return False
+
+
+# #### Stages
+
+class NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+NULL_STAGE = NullStage()
+
+# Wall and CPU time and peak RSS of one stage, plus the counts noted while it runs.
+# CPU time covers this process only, not scoring or export worker processes.
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.profiled = name == profiled_stage and profiler is not None
+
+    def __enter__(self):
+        self.record = {'stage': self.name, 'parent': open_stages[-1].name if open_stages else None}
+        run_report['stages'].append(self.record)
+        open_stages.append(self)
+        if self.profiled:
+            profiler.enable()
+        self.memory = PeakMemory().__enter__()
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        self.record['wall_seconds'] = round(time.perf_counter() - self.wall, 6)
+        self.record['cpu_seconds'] = round(time.process_time() - self.cpu, 6)
+        self.memory.__exit__(*exc)
+        self.record['peak_rss_mb'] = round(self.memory.peak / 2 ** 20, 1)
+        if self.profiled:
+            profiler.disable()
+        open_stages.pop()
+        return False
+
+def stage(name):
+    if run_report is None:
+        return NULL_STAGE
+    return Stage(name)
+
+# Attach counts (rows, candidate pairs before and after a filter, ...) to the innermost open stage
+def note(**counts):
+    if run_report is None or not open_stages:
+        return
+    open_stages[-1].record.update(counts)
+
+
+# #### Run report
+
+# Start recording; profile_stage names a stage to run under cProfile (dumped to '<stage>.prof')
+def start_run(profile_stage=None):
+    global run_report, profiled_stage, profiler
+    run_report = {'started': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages': []}
+    open_stages.clear()
+    profiled_stage = profile_stage
+    profiler = cProfile.Profile() if profile_stage else None
+
+# Stop recording and write the report as JSON
+def finish_run(path):
+    global run_report, profiled_stage, profiler
+    report, run_report = run_report, None
+    if report is None:
+        return None
+    if profiler is not None:
+        report['profile'] = f'{profiled_stage}.prof'
+        profiler.dump_stats(report['profile'])
+    profiled_stage = profiler = None
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, default=int)
+    return report
@@ -0,0 +1,63 @@
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+# Reading the input workbooks and writing the outputs is parsing and
+# formatting in pure Python (xlrd, openpyxl, xlsxwriter), so it is done in
+# worker processes, next to the matching in the main process:
+#   reads   both inputs are parsed at once; matching starts as soon as the
+#           matching columns of both are in, while the full rows needed for
+#           the outputs are still being read
+#   writes  each finished output is handed to a writer and the run goes on;
+#           once queue_size writes are waiting or running the run blocks,
+#           rather than keep every output in memory a second time
+# With one worker everything runs in the main process, in the order it is asked for.
+
+
+class IOScheduler:
+    def __init__(self, workers=0, queue_size=2):
+        self.workers = workers if workers > 0 else os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        self.write_slots = threading.BoundedSemaphore(max(queue_size, 1))
+        self.writes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is None:
+            self.close()
+        elif self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+    def submit(self, function, *args, local=False):
+        if self.executor is not None and not local:
+            return self.executor.submit(function, *args)
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+    # local: run in the main process, e.g. for a frame that is already in memory
+    def read(self, function, *args, local=False):
+        return self.submit(function, *args, local=local)
+
+    # Blocks while queue_size earlier writes are still pending
+    def write(self, function, *args):
+        self.write_slots.acquire()
+        future = self.submit(function, *args)
+        future.add_done_callback(lambda _: self.write_slots.release())
+        self.writes.append(future)
+        return future
+
+    # Wait for every write; the first one that failed raises its error
+    def close(self):
+        try:
+            for future in self.writes:
+                future.result()
+        finally:
+            if self.executor is not None:
+                self.executor.shutdown(cancel_futures=True)
+                self.executor = None
@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+# Columns every stage puts right after 'Index' in its matched rows
+MATCHING_COLUMNS = ['Matching_Index', 'Matching_Attribute']
+
+
+# Comma-joined lists per row, in the order the rows appear. Every item but
+# the first of its row gets the separator in front, so one string-sum group-by
+# builds all the lists at once.
+def joined_per_row(rows, columns):
+    first = ~pd.Series(rows).duplicated().to_numpy()
+    items = {name: np.where(first, values, ', ' + values) for name, values in columns.items()}
+    return pd.DataFrame({'row': rows, **items}).groupby('row', sort=True).sum()
+
+# The rows of one side that have partners, with 'Matching_Index' listing
+# their partner ids in pair order. 'attribute' is either one label for the
+# whole row (the customer stages) or one attribute per pair, listed like the
+# partners (policy numbers).
+def annotate_side(df, rows, partner_ids, attribute):
+    columns = {'Matching_Index': np.asarray(partner_ids).astype(str).astype(object)}
+    if not isinstance(attribute, str):
+        columns['Matching_Attribute'] = np.asarray(attribute, dtype=object)
+    lists = joined_per_row(np.asarray(rows, dtype=np.int64), columns)
+
+    matched = df.iloc[lists.index.to_numpy()]
+    matched = matched.drop(columns=MATCHING_COLUMNS, errors='ignore')
+    matched.insert(1, 'Matching_Index', lists['Matching_Index'].to_numpy(dtype=object))
+    matched.insert(2, 'Matching_Attribute', attribute if isinstance(attribute, str)
+                   else lists['Matching_Attribute'].to_numpy(dtype=object))
+    return matched
+
+# Matched rows of both sides for pairs of row positions (left in df1, right in df2)
+def annotate_matches(df1, df2, left, right, attribute1, attribute2):
+    left = np.asarray(left, dtype=np.int64)
+    right = np.asarray(right, dtype=np.int64)
+    matched1 = annotate_side(df1, left, df2['Index'].to_numpy()[right], attribute1)
+    matched2 = annotate_side(df2, right, df1['Index'].to_numpy()[left], attribute2)
+    return matched1, matched2
@@ -0,0 +1,172 @@
+import numpy as np
+
+from instrumentation import note, stage
+from name_matching import find_customer_pairs, score_customer_pairs
+from pair_checks import dates_within, parse_dates, premium_within_tolerance
+from pair_table import PairTable
+from product_compatibility import check_similarity_for_sorted_list
+
+# A matching rule (Customer+Premium+Tenure, Customer+Policy+Premium) is a set
+# of predicates that a Saiba/Lombard row pair must all pass. Their order does
+# not change which pairs pass, only how much work it takes:
+#   range   the Lombard value lies within a range around the Saiba value
+#           (premium tolerance, start/end dates); can be evaluated as a
+#           sort-based join without looking at every pair
+#   lookup  decided per distinct pair of values (policy type vs product name)
+#   fuzzy   customer-name similarity, the most expensive per pair
+# The plan starts with the range predicate whose join keeps the fewest pairs,
+# applies the other predicates cheapest first, and scores names only on the
+# pairs that are left.
+PREDICATE_KINDS = ['range', 'lookup', 'fuzzy']
+
+# When even the most selective join keeps more than this share of all row
+# pairs, the names are scored first instead (the candidate index prunes most
+# name pairs without scoring them)
+MAX_JOIN_SHARE = 0.25
+
+
+# #### Range join
+
+# Every (left, right) position pair with low[left] <= values[right] <= high[left];
+# invalid rows on either side never pair
+def range_join_counts(low, high, valid1, values, valid2):
+    order = np.nonzero(valid2)[0]
+    order = order[np.argsort(values[order], kind='stable')]
+    sorted_values = values[order]
+    start = np.searchsorted(sorted_values, low, side='left')
+    stop = np.searchsorted(sorted_values, high, side='right')
+    counts = np.where(valid1, np.maximum(stop - start, 0), 0)
+    return order, start, counts
+
+def range_join(low, high, valid1, values, valid2):
+    order, start, counts = range_join_counts(low, high, valid1, values, valid2)
+    left = np.repeat(np.arange(len(low)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    right = order[np.repeat(start, counts) + offsets]
+    # Same order as a nested loop over Saiba then Lombard rows
+    pairs = np.lexsort((right, left))
+    return PairTable(left[pairs], right[pairs], np.zeros(len(pairs)))
+
+
+# #### Predicates
+
+class RangePredicate:
+    kind = 'range'
+
+    # Values of both sides and, per Saiba row, the range of Lombard values that
+    # can pass. The range may be a little wide; test() makes the final decision.
+    def join_input(self, df1, df2):
+        raise NotImplementedError
+
+    def test(self, df1, df2, pairs):
+        raise NotImplementedError
+
+    def join_size(self, df1, df2):
+        return int(range_join_counts(*self.join_input(df1, df2))[2].sum())
+
+    def join(self, df1, df2):
+        with stage(f'{self.name}_join'):
+            pairs = range_join(*self.join_input(df1, df2))
+            kept = pairs.filter(self.test(df1, df2, pairs))
+            note(join_pairs=len(pairs), pairs_after=len(kept))
+        return kept
+
+    def filter(self, df1, df2, pairs):
+        with stage(f'{self.name}_check'):
+            kept = pairs.filter(self.test(df1, df2, pairs))
+            note(pairs_before=len(pairs), pairs_after=len(kept))
+        return kept
+
+class PremiumRange(RangePredicate):
+    name = 'premium'
+
+    def __init__(self, col1, col2, relative=0.02, absolute=0):
+        self.col1, self.col2 = col1, col2
+        self.relative, self.absolute = relative, absolute
+
+    def join_input(self, df1, df2):
+        premium1 = df1[self.col1].to_numpy(dtype=float)
+        premium2 = df2[self.col2].to_numpy(dtype=float)
+        width = self.relative * premium1 + self.absolute
+        # Widened against rounding, so the join never loses a pair the check keeps
+        slack = 1e-9 * (np.abs(premium1) + np.abs(width) + 1)
+        low, high = premium1 - width - slack, premium1 + width + slack
+        return low, high, ~np.isnan(low) & ~np.isnan(high), premium2, ~np.isnan(premium2)
+
+    def test(self, df1, df2, pairs):
+        premium1 = df1[self.col1].to_numpy(dtype=float)[pairs.left]
+        premium2 = df2[self.col2].to_numpy(dtype=float)[pairs.right]
+        return premium_within_tolerance(premium1, premium2, self.relative, self.absolute)
+
+class DateRange(RangePredicate):
+    def __init__(self, name, col1, col2, tolerance_days=0):
+        self.name = name
+        self.col1, self.col2 = col1, col2
+        self.tolerance_days = tolerance_days
+
+    def join_input(self, df1, df2):
+        dates1 = parse_dates(df1, self.col1)
+        dates2 = parse_dates(df2, self.col2)
+        # Compare both sides as integers in their common unit
+        unit = np.result_type(dates1, dates2)
+        tolerance = np.timedelta64(self.tolerance_days, 'D').astype(unit.str.replace('M8', 'm8')).astype(np.int64)
+        values1 = dates1.astype(unit).astype(np.int64)
+        values2 = dates2.astype(unit).astype(np.int64)
+        return values1 - tolerance, values1 + tolerance, ~np.isnat(dates1), values2, ~np.isnat(dates2)
+
+    def test(self, df1, df2, pairs):
+        return dates_within(parse_dates(df1, self.col1)[pairs.left], parse_dates(df2, self.col2)[pairs.right],
+                            self.tolerance_days)
+
+class PolicyTypeLookup:
+    kind = 'lookup'
+    name = 'policy_type'
+
+    def __init__(self, col1, col2, threshold=0.75, use_acronyms=False, path=None):
+        self.col1, self.col2 = col1, col2
+        self.threshold, self.use_acronyms, self.path = threshold, use_acronyms, path
+
+    def filter(self, df1, df2, pairs):
+        return check_similarity_for_sorted_list(df1, df2, self.col1, self.col2, pairs, self.threshold,
+                                                self.use_acronyms, self.path)
+
+class NameSimilarity:
+    kind = 'fuzzy'
+    name = 'customer_name'
+
+    def __init__(self, threshold=71, workers=1, backend='fuzzywuzzy'):
+        self.threshold, self.workers, self.backend = threshold, workers, backend
+
+    # Score names first, over every row pair
+    def join(self, df1, df2):
+        return find_customer_pairs(df1, df2, self.threshold, self.workers, self.backend)
+
+    def filter(self, df1, df2, pairs):
+        return score_customer_pairs(df1, df2, pairs, self.threshold, self.backend)
+
+
+# #### Planning
+
+# Order the predicates of a rule: the first one produces the candidate pairs,
+# the others filter them in turn
+def plan_rule(df1, df2, predicates, planning=True):
+    predicates = sorted(predicates, key=lambda predicate: PREDICATE_KINDS.index(predicate.kind))
+    ranges = [predicate for predicate in predicates if predicate.kind == 'range']
+    join_sizes = {predicate.name: predicate.join_size(df1, df2) for predicate in ranges} if planning else {}
+
+    first = min(ranges, key=lambda predicate: join_sizes[predicate.name]) if join_sizes else None
+    if first is None or join_sizes[first.name] > MAX_JOIN_SHARE * len(df1) * len(df2):
+        first = next(predicate for predicate in predicates if predicate.kind == 'fuzzy')
+    return [first] + [predicate for predicate in predicates if predicate is not first], join_sizes
+
+# The row pairs that pass every predicate of a rule, in the order
+# find_customer_pairs followed by the checks would give them
+def match_rule(df1, df2, predicates, planning=True):
+    with stage('match_plan'):
+        plan, join_sizes = plan_rule(df1, df2, predicates, planning)
+        note(plan=[predicate.name for predicate in plan], join_sizes=join_sizes)
+
+    pairs = plan[0].join(df1, df2)
+    for predicate in plan[1:]:
+        pairs = predicate.filter(df1, df2, pairs)
+    return pairs
@@ -0,0 +1,152 @@
+import argparse
+import csv
+import os
+import sqlite3
+import time
+
+import pandas as pd
+
+from name_normalizer import RULES_FINGERPRINT, preprocess_name
+
+# Customer-name pairs known to be the same customer: a normalized Saiba
+# 'CustName', a normalized Lombard 'INSURED_CUSTOMER_NAME' and their score.
+# Pairs matched by a run are added with their fuzz.ratio score; pairs confirmed
+# by a reviewer are imported from CSV and count as a perfect score. Known pairs
+# are looked up by key before fuzzy scoring and never scored again.
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS aliases (
+        saiba_name TEXT NOT NULL,
+        lombard_name TEXT NOT NULL,
+        score INTEGER NOT NULL,
+        source TEXT NOT NULL,
+        confirmed TEXT NOT NULL,
+        PRIMARY KEY (saiba_name, lombard_name)
+    ) WITHOUT ROWID""",
+    "CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+]
+
+# Sources of an alias; reviewed aliases are never replaced by a run
+RUN_SOURCE = 'run'
+REVIEW_SOURCE = 'review'
+REVIEWED_SCORE = 100
+
+# Columns of the CSV files written by export_aliases and read by import_aliases
+CSV_COLUMNS = ['saiba_name', 'lombard_name', 'score', 'source', 'confirmed']
+
+# Names sent to SQLite per lookup query
+LOOKUP_BATCH = 500
+
+# Seconds a run waits for another run's write to the store to finish (batch jobs share it)
+BUSY_TIMEOUT = 60
+
+# Open store, set by open_alias_store; lookups and recording do nothing without one
+connection = None
+
+
+# #### Opening the store
+
+# Open (or create) the store. Aliases found by runs under other normalization
+# rules are dropped, since their normalized names would not come up again.
+def open_alias_store(path):
+    global connection
+    close_alias_store()
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+    # Readers do not block the one writer, and a writer does not block readers
+    connection.execute("PRAGMA journal_mode=WAL")
+    with connection:
+        for statement in SCHEMA:
+            connection.execute(statement)
+        saved = connection.execute("SELECT value FROM metadata WHERE key = 'rules_fingerprint'").fetchone()
+        if saved is not None and saved[0] != RULES_FINGERPRINT:
+            connection.execute("DELETE FROM aliases WHERE source = ?", (RUN_SOURCE,))
+        connection.execute("INSERT OR REPLACE INTO metadata VALUES ('rules_fingerprint', ?)", (RULES_FINGERPRINT,))
+    return connection
+
+def close_alias_store():
+    global connection
+    if connection is not None:
+        connection.close()
+        connection = None
+
+
+# #### Lookup and recording
+
+# Scores of the known pairs among two lists of normalized names, as {(name1, name2): score}
+def known_aliases(names1, names2):
+    if connection is None:
+        return {}
+    names1 = sorted(set(names1))
+    names2 = set(names2)
+    known = {}
+    for start in range(0, len(names1), LOOKUP_BATCH):
+        batch = names1[start:start + LOOKUP_BATCH]
+        rows = connection.execute(
+            f"SELECT saiba_name, lombard_name, score FROM aliases WHERE saiba_name IN ({', '.join('?' * len(batch))})",
+            batch)
+        known.update(((name1, name2), score) for name1, name2, score in rows if name2 in names2)
+    return known
+
+def add_aliases(aliases, source=RUN_SOURCE):
+    # aliases: (normalized Saiba name, normalized Lombard name, score) rows
+    confirmed = time.strftime('%Y-%m-%d')
+    rows = [(name1, name2, int(score), source, confirmed) for name1, name2, score in aliases if name1 and name2]
+    if source == REVIEW_SOURCE:
+        statement = "INSERT OR REPLACE INTO aliases VALUES (?, ?, ?, ?, ?)"
+    else:
+        statement = "INSERT OR IGNORE INTO aliases VALUES (?, ?, ?, ?, ?)"
+    with connection:
+        connection.executemany(statement, rows)
+    return len(rows)
+
+# Record the customer names of the pairs a stage matched
+def confirm_pairs(df1, df2, pairs):
+    if connection is None or not len(pairs):
+        return 0
+    names1 = df1['CustName'].to_numpy()[pairs.left]
+    names2 = df2['INSURED_CUSTOMER_NAME'].to_numpy()[pairs.right]
+    aliases = {(preprocess_name(name1), preprocess_name(name2)): score
+               for name1, name2, score in zip(names1, names2, pairs.score.tolist())}
+    return add_aliases((name1, name2, score) for (name1, name2), score in aliases.items())
+
+
+# #### Import and export
+
+# Import reviewed pairs from a CSV with 'saiba_name' and 'lombard_name' columns
+# (raw or normalized names); a 'score' column is optional
+def import_aliases(path, source=REVIEW_SOURCE):
+    reviewed = pd.read_csv(path, dtype=str, keep_default_na=False)
+    missing = [col for col in ['saiba_name', 'lombard_name'] if col not in reviewed.columns]
+    if missing:
+        raise ValueError(f"Missing columns in {path}: {', '.join(missing)}")
+    scores = reviewed['score'] if 'score' in reviewed.columns else pd.Series(REVIEWED_SCORE, index=reviewed.index)
+    scores = pd.to_numeric(scores, errors='coerce').fillna(REVIEWED_SCORE)
+    return add_aliases(zip(reviewed['saiba_name'].map(preprocess_name), reviewed['lombard_name'].map(preprocess_name),
+                           scores), source)
+
+def export_aliases(path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        writer.writerows(connection.execute(f"SELECT {', '.join(CSV_COLUMNS)} FROM aliases ORDER BY saiba_name, lombard_name"))
+
+def alias_counts():
+    return dict(connection.execute("SELECT source, COUNT(*) FROM aliases GROUP BY source"))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Manage the store of confirmed customer-name pairs")
+    parser.add_argument('store', nargs='?', default='Name_Aliases.sqlite')
+    parser.add_argument('--import', dest='import_path', help="CSV of reviewed pairs to add")
+    parser.add_argument('--export', dest='export_path', help="CSV file to write every pair to")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.store) and not args.import_path:
+        parser.error(f"{args.store} does not exist")
+    open_alias_store(args.store)
+    if args.import_path:
+        print(f"Imported {import_aliases(args.import_path)} reviewed pairs")
+    if args.export_path:
+        export_aliases(args.export_path)
+        print(f"Wrote {args.export_path}")
+    print(', '.join(f"{count} {source}" for source, count in sorted(alias_counts().items())) or "No pairs")
+    close_alias_store()
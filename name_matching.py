@@ -0,0 +1,373 @@
+import os
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from fuzzywuzzy import fuzz
+
+from instrumentation import note, stage
+from name_aliases import known_aliases
+from name_normalizer import preprocess_name
+from pair_table import PairTable
+
+
+# #### Candidate generation for customer-name matching
+
+# fuzz.ratio scores a pair as round(100 * 2 * M / (len1 + len2)), where M is the
+# number of matched characters. M can never exceed the number of characters the
+# two names have in common (counting repeats), so a pair can only reach the
+# threshold if that overlap is large enough. The index below only hands out
+# pairs that pass this bound, which keeps the result identical to the full
+# cross product while skipping most of the fuzz.ratio calls.
+
+
+# Turn a name into a set of (character, occurrence) tokens so that repeated
+# characters are counted like a multiset
+def name_tokens(name):
+    seen = Counter()
+    tokens = []
+    for char in name:
+        tokens.append((char, seen[char]))
+        seen[char] += 1
+    return tokens
+
+# Minimum number of shared characters a name of this length needs with any
+# partner to reach the threshold (ratio >= threshold - 0.5 before rounding)
+def min_overlap(length, threshold):
+    t = 2 * threshold - 1
+    return -(-t * length // (400 - t))
+
+# Check whether two lengths can reach the threshold at all
+def lengths_compatible(len1, len2, threshold):
+    return 400 * min(len1, len2) >= (2 * threshold - 1) * (len1 + len2)
+
+# Check whether the shared character count can reach the threshold
+def overlap_compatible(overlap, len1, len2, threshold):
+    return 400 * overlap >= (2 * threshold - 1) * (len1 + len2)
+
+def candidate_pairs(names1, names2, threshold=71):
+    names1 = list(names1)
+    names2 = list(names2)
+    total_pairs = len(names1) * len(names2)
+
+    # Without a positive threshold every pair is a candidate
+    if threshold <= 0:
+        pairs = [(i, j) for i in range(len(names1)) for j in range(len(names2))]
+        return pairs, {'total_pairs': total_pairs, 'candidate_pairs': total_pairs, 'pruned_pairs': 0}
+
+    tokens1 = [name_tokens(name) for name in names1]
+    tokens2 = [name_tokens(name) for name in names2]
+
+    # Order tokens from rarest to most common so that prefixes are selective
+    frequency = Counter()
+    for tokens in tokens1 + tokens2:
+        frequency.update(tokens)
+    rank = {token: position for position, token in enumerate(sorted(frequency, key=lambda tok: (frequency[tok], tok)))}
+
+    def prefix(tokens):
+        ordered = sorted(tokens, key=rank.__getitem__)
+        return ordered[:len(tokens) - min_overlap(len(tokens), threshold) + 1]
+
+    # Inverted lists over the prefix tokens of the second list
+    inverted = defaultdict(list)
+    empty2 = []
+    for j, tokens in enumerate(tokens2):
+        if not tokens:
+            empty2.append(j)
+            continue
+        for token in prefix(tokens):
+            inverted[token].append(j)
+
+    counts2 = [Counter(name) for name in names2]
+    pairs = []
+    for i, tokens in enumerate(tokens1):
+        # fuzz.ratio treats two empty names as identical
+        if not tokens:
+            pairs.extend((i, j) for j in empty2)
+            continue
+
+        probed = set()
+        for token in prefix(tokens):
+            probed.update(inverted.get(token, ()))
+
+        len1 = len(tokens)
+        counts1 = Counter(names1[i])
+        for j in sorted(probed):
+            len2 = len(tokens2[j])
+            if not lengths_compatible(len1, len2, threshold):
+                continue
+            overlap = sum((counts1 & counts2[j]).values())
+            if overlap_compatible(overlap, len1, len2, threshold):
+                pairs.append((i, j))
+
+    stats = {
+        'total_pairs': total_pairs,
+        'candidate_pairs': len(pairs),
+        'pruned_pairs': total_pairs - len(pairs),
+    }
+    return pairs, stats
+
+
+# #### Scoring customer-name pairs
+
+# Below this many name pairs the scoring stays in this process
+PARALLEL_MIN_PAIRS = 1_000_000
+
+# Chunks handed to each worker, so uneven chunks still keep every core busy
+CHUNKS_PER_WORKER = 4
+
+# Score the candidate pairs; returns (i, j, score) for every pair at or above the threshold.
+# Name pairs in 'known' (see name_aliases.py) are left out without scoring.
+def score_name_pairs(names1, names2, threshold=71, known=()):
+    pairs, stats = candidate_pairs(names1, names2, threshold)
+    matches = []
+    skipped = 0
+    for i, j in pairs:
+        if (names1[i], names2[j]) in known:
+            skipped += 1
+            continue
+        similarity = fuzz.ratio(names1[i], names2[j])
+        if similarity >= threshold:
+            matches.append((i, j, similarity))
+    stats['known_pairs'] = skipped
+    return matches, stats
+
+# The second name list, threshold and known pairs, sent to each worker process once
+worker_state = {}
+
+def init_worker(names2, threshold, known):
+    worker_state['names2'] = names2
+    worker_state['threshold'] = threshold
+    worker_state['known'] = known
+
+def score_chunk(chunk):
+    start, names1 = chunk
+    matches, stats = score_name_pairs(names1, worker_state['names2'], worker_state['threshold'], worker_state['known'])
+    return [(start + i, j, similarity) for i, j, similarity in matches], stats
+
+# Same result as score_name_pairs, with the first name list split across a
+# process pool. Chunks are contiguous and merged in order, so the matches come
+# back in the same order as the serial scoring. workers=0 uses every core.
+def parallel_score_name_pairs(names1, names2, threshold=71, workers=1, known=()):
+    names1 = list(names1)
+    names2 = list(names2)
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    if workers == 1 or len(names1) < 2 or len(names1) * len(names2) < PARALLEL_MIN_PAIRS:
+        return score_name_pairs(names1, names2, threshold, known)
+
+    chunk_size = -(-len(names1) // (workers * CHUNKS_PER_WORKER))
+    chunks = [(start, names1[start:start + chunk_size]) for start in range(0, len(names1), chunk_size)]
+
+    matches = []
+    stats = Counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(names2, threshold, known)) as executor:
+        for chunk_matches, chunk_stats in executor.map(score_chunk, chunks):
+            matches.extend(chunk_matches)
+            stats.update(chunk_stats)
+    return matches, dict(stats)
+
+
+# Score cells handled per block of the batch score matrix
+BATCH_BLOCK_CELLS = 16_000_000
+
+# Batch backend: rapidfuzz scores whole blocks of names1 x names2 in native
+# code and drops pairs under the cutoff, giving a thresholded sparse score
+# matrix as (i, j, score) rows in the same order as score_name_pairs.
+# Its ratio is the Indel ratio that fuzzywuzzy computes when python-Levenshtein
+# is installed, rounded the same way; fuzzywuzzy's pure-python fallback
+# (difflib) can score a pair lower. benchmarks/scorer_equivalence.py compares
+# the two backends on the sample files. Known pairs are scored with the rest
+# and left out of the result.
+def rapidfuzz_score_name_pairs(names1, names2, threshold=71, workers=1, known=()):
+    from rapidfuzz import fuzz as rapid_fuzz, process
+
+    names1 = list(names1)
+    names2 = list(names2)
+    total_pairs = len(names1) * len(names2)
+    # Anything that rounds up to the threshold must be kept
+    score_cutoff = threshold - 0.5 if threshold > 0.5 else None
+
+    matches = []
+    if names1 and names2:
+        block_rows = max(1, BATCH_BLOCK_CELLS // len(names2))
+        for start in range(0, len(names1), block_rows):
+            scores = process.cdist(names1[start:start + block_rows], names2, scorer=rapid_fuzz.ratio,
+                                   score_cutoff=score_cutoff, dtype=np.float64, workers=workers if workers > 0 else -1)
+            rounded = np.rint(scores).astype(np.int64)
+            rows, cols = np.nonzero(rounded >= threshold)
+            matches.extend(zip((rows + start).tolist(), cols.tolist(), rounded[rows, cols].tolist()))
+    if known:
+        matches = [(i, j, score) for i, j, score in matches if (names1[i], names2[j]) not in known]
+
+    # Every pair is a candidate; the known ones count as not scored, as in score_name_pairs
+    counts1 = Counter(names1)
+    counts2 = Counter(names2)
+    known_pairs = sum(counts1[name1] * counts2[name2] for name1, name2 in known)
+    stats = {'total_pairs': total_pairs, 'candidate_pairs': total_pairs, 'pruned_pairs': 0, 'known_pairs': known_pairs}
+    return matches, stats
+
+# Scorer backends for customer names; each returns (i, j, score) matches and stats
+SCORER_BACKENDS = {
+    'fuzzywuzzy': parallel_score_name_pairs,
+    'rapidfuzz': rapidfuzz_score_name_pairs,
+}
+
+
+# Matches for the known name pairs at or above the threshold, at every
+# position the names take in the lists
+def known_matches(names1, names2, known, threshold=71):
+    positions1 = defaultdict(list)
+    positions2 = defaultdict(list)
+    for i, name in enumerate(names1):
+        positions1[name].append(i)
+    for j, name in enumerate(names2):
+        positions2[name].append(j)
+    return [(i, j, score) for (name1, name2), score in known.items() if score >= threshold
+            for i in positions1[name1] for j in positions2[name2]]
+
+def alias_hit_rate(hits, scored):
+    return round(hits / (hits + scored), 4) if hits + scored else None
+
+
+# #### Normalized-name lookup
+
+# Map every normalized name to the row indices that carry it, in row order
+def build_name_index(normalized_names, indices):
+    name_index = defaultdict(list)
+    for name, index in zip(normalized_names, indices):
+        name_index[name].append(index)
+    return dict(name_index)
+
+
+# #### Checking Customer Names
+
+# Normalized names scored against each other, one per distinct customer name
+def name_lists(data1, data2):
+    names1 = pd.Series(data1['CustName'].unique()).astype(str).apply(preprocess_name)
+    names2 = pd.Series(data2['INSURED_CUSTOMER_NAME'].unique()).astype(str).apply(preprocess_name)
+    return names1, names2
+
+# Compute similarity function; index dicts map each matched name to its row positions
+def compute_similarity(data1, data2, threshold=71, workers=1, backend='fuzzywuzzy'):
+    with stage('name_normalization'):
+        names1, names2 = name_lists(data1, data2)
+
+        # Normalize every row once and look up row positions by normalized name
+        name_index_1 = build_name_index(data1['CustName'].apply(preprocess_name), range(len(data1)))
+        name_index_2 = build_name_index(data2['INSURED_CUSTOMER_NAME'].apply(preprocess_name), range(len(data2)))
+        note(input_rows=len(data1) + len(data2), distinct_names=len(names1) + len(names2))
+
+    results = {}
+    index_dict_1 = defaultdict(list)
+    index_dict_2 = defaultdict(list)
+
+    # Only score the pairs that can possibly reach the threshold and are not known yet
+    with stage('fuzzy_scoring'):
+        known = known_aliases(names1, names2)
+        matches, stats = SCORER_BACKENDS[backend](names1, names2, threshold, workers, known)
+        # Same order as scoring every pair: by position in the first list, then the second
+        matches = sorted(matches + known_matches(names1.tolist(), names2.tolist(), known, threshold))
+        scored = stats['candidate_pairs'] - stats['known_pairs']
+        note(backend=backend, name_pairs=stats['total_pairs'], scored_pairs=scored, pruned_pairs=stats['pruned_pairs'],
+             alias_hits=len(known), alias_hit_rate=alias_hit_rate(len(known), scored), matched_name_pairs=len(matches))
+
+    for i, j, similarity in matches:
+        name1 = names1.iloc[i]
+        name2 = names2.iloc[j]
+        if similarity not in results:
+            results[similarity] = []
+        results[similarity].append((name1, name2))
+        index_dict_1[name1] = name_index_1.get(name1, [])
+        index_dict_2[name2] = name_index_2.get(name2, [])
+
+    return results, index_dict_1, index_dict_2
+
+# Find the row pairs whose customer names are similar, best scores first
+# within each Saiba row and Saiba rows in 'Index' order
+def find_customer_pairs(data1, data2, threshold=71, workers=1, backend='fuzzywuzzy'):
+    similarity_dict, index_dict_1, index_dict_2 = compute_similarity(data1, data2, threshold=threshold, workers=workers, backend=backend)
+
+    blocks = []
+    for similarity in sorted(similarity_dict, reverse=True):
+        for name1, name2 in similarity_dict[similarity]:
+            blocks.append((index_dict_1[name1], index_dict_2[name2], similarity))
+
+    pairs = PairTable.from_blocks(blocks).unique()
+    note(customer_pairs=len(pairs))
+    if not len(pairs):
+        return pairs
+    return pairs.sort_by_left(data1['Index'].to_numpy())
+
+
+# #### Scoring given row pairs
+
+# Position of every row's normalized name in a name list (its first
+# occurrence), or -1 when the row's name is not in the list
+def name_positions(normalized_names, names):
+    positions = {}
+    for position, name in enumerate(names):
+        positions.setdefault(name, position)
+    return np.array([positions.get(name, -1) for name in normalized_names], dtype=np.int64)
+
+# Score one list of name pairs: fuzz.ratio, or the rounded rapidfuzz ratio.
+# Known pairs take their saved score; pairs that cannot reach the threshold by
+# their shared characters are not scored.
+def score_listed_names(names1, names2, threshold=71, backend='fuzzywuzzy', known=None):
+    if backend == 'rapidfuzz':
+        from rapidfuzz import fuzz as rapid_fuzz
+        ratio = lambda name1, name2: int(np.rint(rapid_fuzz.ratio(name1, name2)))
+    else:
+        ratio = fuzz.ratio
+
+    known = known or {}
+    scores = np.zeros(len(names1), dtype=np.int64)
+    scored = hits = 0
+    for k, (name1, name2) in enumerate(zip(names1, names2)):
+        if (name1, name2) in known:
+            scores[k] = known[name1, name2]
+            hits += 1
+            continue
+        if threshold > 0:
+            if not lengths_compatible(len(name1), len(name2), threshold):
+                continue
+            if not overlap_compatible(sum((Counter(name1) & Counter(name2)).values()), len(name1), len(name2), threshold):
+                continue
+        scores[k] = ratio(name1, name2)
+        scored += 1
+    return scores, scored, hits
+
+# Keep the given row pairs whose customer names are similar, e.g. the pairs a
+# matching plan kept after its cheaper checks. The result is what
+# find_customer_pairs followed by those checks gives: Saiba rows in 'Index'
+# order, then best score first, then Lombard names in order of first
+# appearance, then Lombard rows in order.
+def score_customer_pairs(data1, data2, pairs, threshold=71, backend='fuzzywuzzy'):
+    with stage('name_normalization'):
+        names1, names2 = name_lists(data1, data2)
+        positions1 = name_positions(data1['CustName'].apply(preprocess_name), names1)
+        positions2 = name_positions(data2['INSURED_CUSTOMER_NAME'].apply(preprocess_name), names2)
+        note(input_rows=len(data1) + len(data2), distinct_names=len(names1) + len(names2))
+
+    with stage('fuzzy_scoring'):
+        pair_positions1 = positions1[pairs.left]
+        pair_positions2 = positions2[pairs.right]
+        pairs = pairs.filter((pair_positions1 >= 0) & (pair_positions2 >= 0))
+        pair_positions1 = positions1[pairs.left]
+        pair_positions2 = positions2[pairs.right]
+
+        # Score every distinct name pair once
+        name_pairs, pair_name_pair = np.unique(pair_positions1 * max(len(names2), 1) + pair_positions2, return_inverse=True)
+        listed1 = names1.to_numpy()[name_pairs // max(len(names2), 1)]
+        listed2 = names2.to_numpy()[name_pairs % max(len(names2), 1)]
+        name_pair_scores, scored, hits = score_listed_names(listed1, listed2, threshold, backend,
+                                                            known_aliases(listed1, listed2))
+        scores = name_pair_scores[pair_name_pair.reshape(-1)]
+        keep = scores >= threshold
+        pairs = PairTable(pairs.left[keep], pairs.right[keep], scores[keep])
+        note(backend=backend, name_pairs=len(name_pairs), scored_pairs=scored, pruned_pairs=len(name_pairs) - scored - hits,
+             alias_hits=hits, alias_hit_rate=alias_hit_rate(hits, scored), matched_name_pairs=int((name_pair_scores >= threshold).sum()))
+
+    order = np.lexsort((pairs.right, positions2[pairs.right], -pairs.score, data1['Index'].to_numpy()[pairs.left]))
+    return pairs.take(order)
@@ -0,0 +1,155 @@
+import hashlib
+import json
+import os
+import re
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+import pandas as pd
+
+# Titles and company suffixes removed before anything else
+TITLE_PATTERN = re.compile(r'\b(Mr|Ms|Ltd|LLP|Pvt|Private|Limited|LLC|LTD|Llp|ltd|lp|PLLP|Pllp|P.L.C.|ms|m/s|pvtltd)\b', flags=re.IGNORECASE)
+AND_PATTERN = re.compile(r'\b(and|AND|And|&)\b', flags=re.IGNORECASE)
+PUNCTUATION_PATTERN = re.compile(r'[.,]')
+WHITESPACE_PATTERN = re.compile(r'\s+')
+
+# Words dropped from customer names, in the order they are removed
+WORDS_TO_OMIT = [
+    'industry', 'industries', 'corp', 'corporation', 'inc', 'incorporated', 'foundation',
+    'company', 'co', 'limited', 'ltd', 'pvt', 'llc', 'llp', 'and', 'pvtltd', '&', 'm/s', 'ms'
+]
+
+# Consecutive words that start and end with a letter or digit can be removed
+# together in one alternation without changing the result. A word that starts
+# or ends with a symbol ('&') depends on what the earlier removals left around
+# it, so it keeps its own pass in list order.
+def compile_omit_patterns(words):
+    patterns = []
+    group = []
+    for word in words:
+        if re.match(r'\w', word) and re.search(r'\w$', word):
+            group.append(word)
+            continue
+        if group:
+            patterns.append(re.compile(r'\b(' + '|'.join(group) + r')\b', flags=re.IGNORECASE))
+            group = []
+        patterns.append(re.compile(r'\b' + word + r'\b', flags=re.IGNORECASE))
+    if group:
+        patterns.append(re.compile(r'\b(' + '|'.join(group) + r')\b', flags=re.IGNORECASE))
+    return patterns
+
+OMIT_PATTERNS = compile_omit_patterns(WORDS_TO_OMIT)
+
+# Size of the in-memory cache of raw -> normalized names
+CACHE_SIZE = 2 ** 20
+
+# Cached results are only reused while the rules above stay the same
+RULES_FINGERPRINT = hashlib.sha1('\n'.join(
+    [TITLE_PATTERN.pattern, AND_PATTERN.pattern, PUNCTUATION_PATTERN.pattern]
+    + [pattern.pattern for pattern in OMIT_PATTERNS]
+    + [WHITESPACE_PATTERN.pattern]
+).encode('utf-8')).hexdigest()
+
+# Names kept in the on-disk cache; the ones least recently used by a run are dropped first
+SAVED_NAMES_LIMIT = 200_000
+
+# Seconds between attempts to lock the on-disk cache while another run saves it
+LOCK_RETRY_SECONDS = 0.1
+
+# Raw -> normalized names read from the on-disk cache, and those used since
+# (looked up or normalized). Both are emptied once saved, so a long-running
+# process (a batch worker) neither grows them without bound nor writes one
+# job's names into the next job's cache.
+loaded_names = {}
+used_names = {}
+
+
+def normalize_name(name):
+    name = TITLE_PATTERN.sub('', name)
+    name = AND_PATTERN.sub('and', name)
+    name = PUNCTUATION_PATTERN.sub('', name)
+    for pattern in OMIT_PATTERNS:
+        name = pattern.sub('', name)
+    return WHITESPACE_PATTERN.sub('', name).lower()
+
+@lru_cache(maxsize=CACHE_SIZE)
+def cached_normalize_name(name):
+    normalized = loaded_names.get(name)
+    if normalized is None:
+        normalized = normalize_name(name)
+    used_names[name] = normalized
+    return normalized
+
+# Preprocess name function
+def preprocess_name(name):
+    if pd.isna(name):
+        return ""
+    return cached_normalize_name(str(name))
+
+
+# #### On-disk cache
+
+def read_name_cache(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        saved = json.load(f)
+    if saved.get('fingerprint') != RULES_FINGERPRINT:
+        return {}
+    return saved.get('names', {})
+
+# Load normalized names saved by a previous run, ignoring files written with other rules
+def load_name_cache(path):
+    global loaded_names
+    loaded_names = read_name_cache(path)
+    used_names.clear()
+    # Names cached in memory by an earlier job would never reach this job's file
+    cached_normalize_name.cache_clear()
+    return len(loaded_names)
+
+# Exclusive lock on '<path>.lock' while the cache is merged and replaced, so
+# runs sharing the file (batch jobs) never drop each other's names
+@contextmanager
+def locked_name_cache(path):
+    with open(f'{path}.lock', 'a+b') as lock:
+        if os.name == 'nt':
+            import msvcrt
+            while True:
+                try:
+                    msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(LOCK_RETRY_SECONDS)
+            try:
+                yield
+            finally:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+# Merge the names used since loading into the file, as it is now: another run
+# sharing the file may have saved its own names in the meantime. Names used by
+# this run move to the end, and only the SAVED_NAMES_LIMIT most recently used are kept.
+def save_name_cache(path):
+    global loaded_names
+    with locked_name_cache(path):
+        names = read_name_cache(path)
+        for name, normalized in used_names.items():
+            names.pop(name, None)
+            names[name] = normalized
+        if len(names) > SAVED_NAMES_LIMIT:
+            names = dict(list(names.items())[-SAVED_NAMES_LIMIT:])
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'fingerprint': RULES_FINGERPRINT, 'names': names}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+    loaded_names = {}
+    used_names.clear()
+    cached_normalize_name.cache_clear()
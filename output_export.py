@@ -0,0 +1,66 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from input_loading import render_row_labels
+from workbook_io import LOMBARD_SHEET, SAIBA_SHEET, save_working_data, working_path, write_sheets
+
+# Formats the run outputs can be written in: one workbook with two sheets,
+# or one CSV/Parquet file per sheet for systems that don't read Excel
+EXPORT_FORMATS = ['xlsx', 'csv', 'parquet']
+
+
+# Parquet needs one type per column, so columns mixing e.g. numbers and
+# text (PRODUCT_CODE) are written as text
+def parquet_frame(df):
+    import pyarrow as pa
+
+    df = df.copy()
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = df[col].map(lambda value: value if pd.isna(value) else str(value))
+    return df
+
+def export_dataset(name, saiba_data, lombard_data, formats):
+    saiba_data, lombard_data = render_row_labels(saiba_data, lombard_data)
+    for export_format in formats:
+        if export_format == 'xlsx':
+            write_sheets(f'{name}.xlsx', saiba_data, lombard_data)
+        elif export_format == 'csv':
+            saiba_data.to_csv(working_path(name, SAIBA_SHEET, 'csv'), index=False)
+            lombard_data.to_csv(working_path(name, LOMBARD_SHEET, 'csv'), index=False)
+        elif export_format == 'parquet':
+            parquet_frame(saiba_data).to_parquet(working_path(name, SAIBA_SHEET, 'parquet'), index=False)
+            parquet_frame(lombard_data).to_parquet(working_path(name, LOMBARD_SHEET, 'parquet'), index=False)
+        else:
+            raise ValueError(f"Unknown export format: {export_format}")
+
+# The columnar working copy and the exports of one dataset, written as one job
+def write_dataset(name, saiba_data, lombard_data, formats):
+    save_working_data(name, saiba_data, lombard_data)
+    export_dataset(name, saiba_data, lombard_data, formats)
+
+# Write every output once, e.g. {'Matched_Data': (saiba_data, lombard_data)}.
+# With more than one worker the outputs are written in separate processes
+# (0 = every core); the writers are pure Python, so threads would not help.
+def export_outputs(outputs, formats=('xlsx',), workers=1):
+    unknown = sorted(set(formats) - set(EXPORT_FORMATS))
+    if unknown:
+        raise ValueError(f"Unknown export formats: {', '.join(unknown)}")
+
+    workers = min(workers if workers > 0 else os.cpu_count() or 1, len(outputs))
+    if workers <= 1:
+        for name, (saiba_data, lombard_data) in outputs.items():
+            export_dataset(name, saiba_data, lombard_data, formats)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(export_dataset, name, saiba_data, lombard_data, formats)
+                   for name, (saiba_data, lombard_data) in outputs.items()]
+        for future in futures:
+            future.result()
@@ -0,0 +1,143 @@
+import numpy as np
+
+from instrumentation import note, stage
+from pair_checks import parse_dates
+
+# How many partners a row keeps after the checks:
+#   all         every pair that passed (the full audit view)
+#   best        per Saiba row its best pair, then per Lombard row the best of those
+#   one_to_one  a minimum-cost one-to-one assignment within each group of linked rows
+ASSIGNMENT_MODES = ['all', 'best', 'one_to_one']
+
+
+# #### Pair costs
+
+# Lower is better: the name score first, then how close the premiums and the
+# start dates are. The tie-breaking part stays below 1, so it never
+# outweighs a single point of name score.
+def pair_costs(df1, df2, pairs):
+    premium1 = df1['OD Premium'].to_numpy(dtype=float)[pairs.left]
+    premium2 = df2['APPLICABLE_PREMIUM_AMOUNT'].to_numpy(dtype=float)[pairs.right]
+    premium_cost = np.abs(premium1 - premium2) / np.maximum(np.abs(premium1), 1)
+
+    start1 = parse_dates(df1, 'Policy_StartDate')[pairs.left]
+    start2 = parse_dates(df2, 'POLICY_START_DATE')[pairs.right]
+    date_cost = np.abs((start1 - start2) / np.timedelta64(1, 'D')) / 365
+
+    tie_break = np.nan_to_num(np.minimum(premium_cost, 1), nan=1) + np.nan_to_num(np.minimum(date_cost, 1), nan=1)
+    return (100 - pairs.score) + tie_break / 3
+
+
+# #### Best partner per row
+
+# Position of the cheapest pair for every distinct key, first pair on ties
+def cheapest_per_key(keys, costs):
+    order = np.lexsort((np.arange(len(keys)), costs, keys))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = keys[order[1:]] != keys[order[:-1]]
+    return order[first]
+
+# Every Saiba row keeps its cheapest pair, and a Lombard row picked by several
+# Saiba rows keeps the cheapest of those, so no row keeps more than one partner
+def best_partner_pairs(pairs, costs):
+    best_left = cheapest_per_key(pairs.left, costs)
+    best = best_left[cheapest_per_key(pairs.right[best_left], costs[best_left])]
+    keep = np.zeros(len(pairs), dtype=bool)
+    keep[best] = True
+    return pairs.filter(keep)
+
+
+# #### One-to-one assignment
+
+# Minimum-cost assignment of every row of a cost matrix to a distinct column
+# (Hungarian method with potentials, O(n^2 m)); needs rows <= columns
+def assign_rows(cost):
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    row_of_column = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        row_of_column[0] = i
+        j0 = 0
+        min_slack = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while row_of_column[j0]:
+            used[j0] = True
+            i0 = row_of_column[j0]
+            free = ~used[1:]
+            slack = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (slack < min_slack[1:])
+            min_slack[1:][better] = slack[better]
+            way[1:][better] = j0
+            candidates = np.where(free, min_slack[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            used_columns = np.nonzero(used)[0]
+            u[row_of_column[used_columns]] += delta
+            v[used_columns] -= delta
+            min_slack[1:][free] -= delta
+            j0 = j1
+        while j0:
+            j1 = way[j0]
+            row_of_column[j0] = row_of_column[j1]
+            j0 = j1
+    columns = np.nonzero(row_of_column[1:])[0]
+    return row_of_column[columns + 1] - 1, columns
+
+# Groups of Saiba and Lombard rows linked by pairs (connected components)
+def pair_groups(pairs):
+    parent = {}
+
+    def find(node):
+        root = node
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        while parent[node] != root:
+            parent[node], node = root, parent[node]
+        return root
+
+    for left, right in zip(pairs.left.tolist(), pairs.right.tolist()):
+        parent[find(('S', left))] = find(('L', right))
+    group_ids = {}
+    return np.array([group_ids.setdefault(find(('S', left)), len(group_ids)) for left in pairs.left.tolist()])
+
+def one_to_one_pairs(pairs, costs):
+    if not len(pairs):
+        return pairs
+    group_of_pair = pair_groups(pairs)
+    keep = np.zeros(len(pairs), dtype=bool)
+    order = np.argsort(group_of_pair, kind='stable')
+    for positions in np.split(order, np.nonzero(np.diff(group_of_pair[order]))[0] + 1):
+        rows, row_codes = np.unique(pairs.left[positions], return_inverse=True)
+        columns, column_codes = np.unique(pairs.right[positions], return_inverse=True)
+        # Rows and columns without a pair between them cost more than any real assignment
+        missing = costs[positions].sum() + 1
+        matrix = np.full((len(rows), len(columns)), missing)
+        matrix[row_codes, column_codes] = costs[positions]
+        position_of = np.full(matrix.shape, -1)
+        position_of[row_codes, column_codes] = positions
+        if len(rows) <= len(columns):
+            assigned_rows, assigned_columns = assign_rows(matrix)
+        else:
+            assigned_columns, assigned_rows = assign_rows(matrix.T)
+        chosen = position_of[assigned_rows, assigned_columns]
+        keep[chosen[chosen >= 0]] = True
+    return pairs.filter(keep)
+
+
+# Reduce the pairs that passed every check to the partners each row keeps.
+# The pairs stay in their original order.
+def assign_pairs(df1, df2, pairs, mode='all'):
+    if mode not in ASSIGNMENT_MODES:
+        raise ValueError(f"Unknown pair assignment mode: {mode}")
+    if mode == 'all' or not len(pairs):
+        return pairs
+    with stage('pair_assignment'):
+        costs = pair_costs(df1, df2, pairs)
+        if mode == 'best':
+            kept = best_partner_pairs(pairs, costs)
+        else:
+            kept = one_to_one_pairs(pairs, costs)
+        note(mode=mode, pairs_before=len(pairs), pairs_after=len(kept))
+    return kept
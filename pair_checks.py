@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+
+# Premium and date rules shared by the range predicates of match_planner.py and
+# the pair costs of pair_assignment.py
+
+
+# #### Checking Premium Amount
+
+# Same rule as the former is_within_2_percent: the relative tolerance is taken
+# from the Saiba premium only, so a negative Saiba premium never matches
+def premium_within_tolerance(premium1, premium2, relative=0.02, absolute=0):
+    return np.abs(premium1 - premium2) <= relative * premium1 + absolute
+
+
+# #### Checking Start+End Dates
+
+# Parse a date column to datetime64 once per frame; unparseable values become NaT
+def parse_dates(df, col):
+    return pd.to_datetime(df[col], errors='coerce', dayfirst=True).to_numpy()
+
+# Dates match when they are at most this many days apart; NaT never matches
+def dates_within(dates1, dates2, tolerance_days=0):
+    return np.abs(dates1 - dates2) <= np.timedelta64(tolerance_days, 'D')
@@ -0,0 +1,47 @@
+import numpy as np
+
+
+# Candidate matches held as three parallel arrays: Saiba row positions,
+# Lombard row positions and the name score. Positions refer to rows of the
+# data frames the pairs were built from, so values are read with a plain
+# array lookup instead of scanning the 'Index' column.
+class PairTable:
+    def __init__(self, left=(), right=(), score=()):
+        self.left = np.asarray(left, dtype=np.int64)
+        self.right = np.asarray(right, dtype=np.int64)
+        self.score = np.asarray(score, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.left)
+
+    # Build the table from blocks where every row of one list pairs with every row of the other
+    @classmethod
+    def from_blocks(cls, blocks):
+        left, right, score = [], [], []
+        for rows1, rows2, block_score in blocks:
+            rows1 = np.asarray(rows1, dtype=np.int64)
+            rows2 = np.asarray(rows2, dtype=np.int64)
+            left.append(np.repeat(rows1, len(rows2)))
+            right.append(np.tile(rows2, len(rows1)))
+            score.append(np.full(len(rows1) * len(rows2), block_score, dtype=np.int64))
+        if not left:
+            return cls()
+        return cls(np.concatenate(left), np.concatenate(right), np.concatenate(score))
+
+    def take(self, positions):
+        return PairTable(self.left[positions], self.right[positions], self.score[positions])
+
+    def filter(self, mask):
+        return self.take(np.asarray(mask, dtype=bool))
+
+    # Drop repeated (left, right) pairs, keeping the first occurrence in table order
+    def unique(self):
+        if not len(self):
+            return self
+        keys = self.left * (int(self.right.max()) + 1) + self.right
+        _, first = np.unique(keys, return_index=True)
+        return self.take(np.sort(first))
+
+    # Stable sort by a key per Saiba row, e.g. the 'Index' row ids
+    def sort_by_left(self, left_keys):
+        return self.take(np.argsort(np.asarray(left_keys)[self.left], kind='stable'))
@@ -0,0 +1,67 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import note, stage
+from match_annotation import annotate_matches
+
+# Runs of whitespace inside a policy or endorsement number
+WHITESPACE_PATTERN = re.compile(r'\s+')
+# Separators written differently by the two systems ('2001-1234-00' vs '2001/1234/00')
+SEPARATOR_PATTERN = re.compile(r'[-_./\\|]+')
+
+
+# #### Canonical policy numbers
+
+def canonical_policy_number(value):
+    if pd.isna(value):
+        return None
+    # Numbers read from Excel as floats ('1234.0') compare equal to the same text
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = WHITESPACE_PATTERN.sub('', str(value)).upper()
+    text = SEPARATOR_PATTERN.sub('/', text).strip('/')
+    return text or None
+
+# Canonicalize a column, computing each distinct value once
+def canonical_policy_numbers(series):
+    codes, uniques = pd.factorize(series)
+    canonical = pd.Series([canonical_policy_number(value) for value in uniques] + [None], dtype=object)
+    return canonical.to_numpy()[codes].tolist()
+
+
+# #### Checking Policy and Endorsement Numbers
+
+# Match Saiba 'PolicyNo'/'EndoNo' against Lombard 'POL_NUM_TXT' in one hash join.
+# Each match is a Saiba row position, a Lombard row position and the Saiba
+# column that matched, with policy matches before endorsement matches.
+def policy_number_matches(data1, data2):
+    broker_keys = pd.concat([
+        pd.DataFrame({'S': range(len(data1)), 'key': canonical_policy_numbers(data1['PolicyNo']), 'attribute': 'PolicyNo'}),
+        pd.DataFrame({'S': range(len(data1)), 'key': canonical_policy_numbers(data1['EndoNo']), 'attribute': 'EndoNo'}),
+    ], ignore_index=True).dropna(subset=['key'])
+    company_keys = pd.DataFrame({'L': range(len(data2)), 'key': canonical_policy_numbers(data2['POL_NUM_TXT'])}).dropna(subset=['key'])
+
+    return broker_keys.merge(company_keys, on='key', how='inner')[['S', 'L', 'attribute']]
+
+def match_policy_numbers(data1, data2):
+    with stage('policy_number_join'):
+        matches = policy_number_matches(data1, data2)
+        note(input_rows=len(data1) + len(data2), matched_pairs=len(matches))
+
+    # Matched rows with their partners; Saiba rows list 'POL_NUM_TXT' and
+    # Lombard rows the Saiba column for every partner
+    matched_broker_data, matched_company_data = annotate_matches(
+        data1, data2, matches['S'], matches['L'],
+        np.full(len(matches), 'POL_NUM_TXT', dtype=object), matches['attribute'])
+
+    # Rows without any match stay as they are
+    broker_matched = np.zeros(len(data1), dtype=bool)
+    broker_matched[matches['S'].to_numpy()] = True
+    company_matched = np.zeros(len(data2), dtype=bool)
+    company_matched[matches['L'].to_numpy()] = True
+    unmatched_broker_data = data1[~broker_matched]
+    unmatched_company_data = data2[~company_matched]
+
+    return matched_broker_data, matched_company_data, unmatched_broker_data, unmatched_company_data
@@ -0,0 +1,135 @@
+import os
+import re
+from difflib import SequenceMatcher
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import note, stage
+
+# Columns of the compatibility table
+TABLE_COLUMNS = ['Policy Type', 'PRODUCT_NAME', 'Compatible', 'Rule', 'Score']
+
+# Rows with this rule were set by hand and are never recomputed
+MANUAL_RULE = 'manual'
+
+
+def preprocess_text(text):
+    if pd.isna(text):
+        return ""
+    return str(text).lower().strip()
+
+def acronym(word):
+    # Extract acronym from a phrase
+    return ''.join([char for char in word if char.isupper()])
+
+def clean_text(text):
+    # Remove punctuation and make lowercase
+    return re.sub(r'[^A-Za-z0-9\s]', '', text).lower()
+
+def similarity(a, b):
+    # Compute similarity between two strings
+    return SequenceMatcher(None, a, b).ratio()
+
+def find_similar_elements(list1, list2, threshold=0.75):
+    results = []
+    acronyms_list1 = [acronym(str(item)) for item in list1]
+    acronyms_list2 = [acronym(str(item)) for item in list2]
+
+    # Check for acronym matches
+    for i, acr1 in enumerate(acronyms_list1):
+        for j, acr2 in enumerate(acronyms_list2):
+            if acr1 == acr2 and acr1:  # Only consider non-empty acronyms
+                results.append((list1[i], list2[j]))
+
+    # Check for similarity in remaining data
+    for item1 in list1:
+        for item2 in list2:
+            cleaned_item1 = clean_text(str(item1))
+            cleaned_item2 = clean_text(str(item2))
+            if similarity(cleaned_item1, cleaned_item2) >= threshold:
+                results.append((item1, item2))
+
+    return results
+
+
+# #### Product compatibility table
+
+# Key used for a policy type or product name in the table
+def table_key(value):
+    if pd.isna(value):
+        return ""
+    return str(value).strip()
+
+# Decide whether a policy type and a product name are compatible, and by which rule.
+# find_similar_elements only ever sees lowercased text, so its acronym check
+# never fires; the 'acronym' rule compares acronyms of the original casing
+# instead and is only applied when use_acronyms is set.
+def product_rule(policy_type, product_name, threshold=0.75, use_acronyms=False):
+    if use_acronyms:
+        acronym1 = acronym(policy_type)
+        if acronym1 and acronym1 == acronym(product_name):
+            return True, 'acronym', 1.0
+
+    text1 = preprocess_text(policy_type)
+    text2 = preprocess_text(product_name)
+    score = similarity(clean_text(text1), clean_text(text2))
+    if find_similar_elements([text1], [text2], threshold):
+        return True, 'similarity', score
+    return False, '', score
+
+# Load the hand-set rows of a saved table
+def load_manual_rules(path):
+    if not path or not os.path.exists(path):
+        return {}
+    saved = pd.read_csv(path, dtype=str, keep_default_na=False)
+    manual = saved[saved['Rule'].str.strip().str.lower() == MANUAL_RULE]
+    compatible = manual['Compatible'].str.strip().str.lower().isin(['true', '1', 'yes'])
+    return dict(zip(zip(manual['Policy Type'], manual['PRODUCT_NAME']), compatible))
+
+# Build the table for the given distinct (Policy Type, PRODUCT_NAME) pairs.
+# Hand-set rows from the saved table win over the computed rules.
+def build_compatibility_table(value_pairs, threshold=0.75, use_acronyms=False, path=None):
+    manual_rules = load_manual_rules(path)
+    rows = {}
+    for (policy_type, product_name), compatible in manual_rules.items():
+        rows[policy_type, product_name] = [policy_type, product_name, compatible, MANUAL_RULE, np.nan]
+    for policy_type, product_name in value_pairs:
+        if (policy_type, product_name) not in rows:
+            compatible, rule, score = product_rule(policy_type, product_name, threshold, use_acronyms)
+            rows[policy_type, product_name] = [policy_type, product_name, compatible, rule, round(score, 4)]
+    table = pd.DataFrame(list(rows.values()), columns=TABLE_COLUMNS)
+    return table.sort_values(['Policy Type', 'PRODUCT_NAME'], ignore_index=True)
+
+# Written to a file of its own first, so a run reading the table never sees it half written
+def save_compatibility_table(table, path):
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    table.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+# Keep the pairs whose policy type and product name are compatible in the table
+def check_similarity_for_sorted_list(df1, df2, col1, col2, pairs, threshold=0.75, use_acronyms=False, path=None):
+    with stage('policy_type_check'):
+        kept = compatible_pairs(df1, df2, col1, col2, pairs, threshold, use_acronyms, path)
+        note(pairs_before=len(pairs), pairs_after=len(kept))
+    return kept
+
+def compatible_pairs(df1, df2, col1, col2, pairs, threshold, use_acronyms, path):
+    # Distinct policy types and product names, and the ones each pair uses
+    codes1, values1 = pd.factorize(df1[col1].map(table_key))
+    codes2, values2 = pd.factorize(df2[col2].map(table_key))
+    pair_codes1 = codes1[pairs.left]
+    pair_codes2 = codes2[pairs.right]
+    used = set(zip(pair_codes1.tolist(), pair_codes2.tolist()))
+
+    table = build_compatibility_table([(values1[i], values2[j]) for i, j in sorted(used)], threshold, use_acronyms, path)
+    note(value_pairs=len(used))
+    if path:
+        save_compatibility_table(table, path)
+
+    # Look every pair up in a small matrix over the distinct values
+    compatible = dict(zip(zip(table['Policy Type'], table['PRODUCT_NAME']), table['Compatible']))
+    matrix = np.zeros((len(values1), len(values2)), dtype=bool)
+    for i, j in used:
+        matrix[i, j] = compatible[values1[i], values2[j]]
+    return pairs.filter(matrix[pair_codes1, pair_codes2])
@@ -0,0 +1,77 @@
+import json
+import os
+
+# Optional JSON file in the working directory that overrides the defaults below
+SETTINGS_FILE = 'Reconciliation_Settings.json'
+
+# Files kept between runs and shared by them. Relative paths are relative to the
+# directory of the settings file (the working directory when there is none), so
+# runs from other directories, like batch jobs, use the same files.
+SHARED_FILE_SETTINGS = ['name_cache_file', 'product_compatibility_file', 'alias_store']
+
+DEFAULTS = {
+    # Premium check: |Saiba premium - Lombard premium| <= relative * Saiba premium + absolute
+    'premium_relative_tolerance': 0.02,
+    'premium_absolute_tolerance': 0,
+    # Tenure check: start and end dates may differ by up to this many days
+    'tenure_start_tolerance_days': 0,
+    'tenure_end_tolerance_days': 0,
+    # Processes used for fuzzy name scoring on large inputs (0 = every core, 1 = serial)
+    'scoring_workers': 0,
+    # Customer-name scorer: 'fuzzywuzzy' (fuzz.ratio per pair) or 'rapidfuzz' (batch score matrix)
+    'scorer_backend': 'fuzzywuzzy',
+    # Customer names normalized by earlier runs (see name_normalizer.py)
+    'name_cache_file': 'Name_Cache.json',
+    # Policy type check: table of (Policy Type, PRODUCT_NAME) decisions, saved between runs.
+    # Rows marked 'manual' in its Rule column are kept as set by hand. None disables the file.
+    'product_compatibility_file': 'Product_Compatibility.csv',
+    # Also treat equal acronyms of the original text as compatible ('PCV' and 'Private Car Vehicle')
+    'policy_type_acronym_rule': False,
+    # Partners kept per row by the customer stages: 'all' pairs that pass the checks (audit runs),
+    # 'best' pair of each Saiba row, then of each Lombard row among those (one partner per row at most),
+    # or 'one_to_one' assignment within linked rows
+    'pair_assignment': 'all',
+    # Store of customer-name pairs confirmed by earlier runs and reviewers, looked up before
+    # fuzzy scoring (see name_aliases.py); None disables it
+    'alias_store': 'Name_Aliases.sqlite',
+    # Customer stages: join on premium and dates first and score names only on the pairs left
+    # (same matches, fewer fuzz.ratio calls); False scores every name pair first
+    'rule_planning': True,
+    # Incremental runs: name of the saved row fingerprints and matches (e.g. 'Reconciliation_State').
+    # Unchanged rows keep their Index and matches; None re-matches everything from scratch.
+    'incremental_state': None,
+    # Hold only the columns the stages match on while matching; the rest of each row waits in a
+    # working file until the outputs are written (each input is parsed once either way)
+    'projected_loading': True,
+    # Hold the matching columns as categoricals, Arrow strings and float32 premiums where lossless
+    'compact_frames': True,
+    # Output formats written by Lombard_Saiba_Code.py: any of 'xlsx', 'csv', 'parquet'
+    'export_formats': ['xlsx'],
+    # Processes writing the output files (0 = every core, 1 = one after another)
+    'export_workers': 1,
+    # Processes reading both inputs at once and writing the outputs in the background while the run
+    # goes on (0 = every core; 1 = read and write in turn, exporting with export_workers processes)
+    'io_workers': 0,
+    # Outputs handed to the writers and not yet written; the run waits rather than queue more
+    'io_queue_size': 2,
+    # Run report: JSON file with time, memory, row and pair counts per stage (None = not recorded)
+    'run_report': None,
+    # Stage to run under cProfile while recording, e.g. 'fuzzy_scoring' (dumped to '<stage>.prof')
+    'profile_stage': None,
+}
+
+
+def load_settings(path=SETTINGS_FILE):
+    settings = dict(DEFAULTS)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            overrides = json.load(f)
+        unknown = sorted(set(overrides) - set(DEFAULTS))
+        if unknown:
+            raise ValueError(f"Unknown settings in {path}: {', '.join(unknown)}")
+        settings.update(overrides)
+    base_dir = os.path.dirname(os.path.abspath(path))
+    for key in SHARED_FILE_SETTINGS:
+        if settings[key]:
+            settings[key] = os.path.join(base_dir, settings[key])
+    return settings
@@ -0,0 +1,175 @@
+import datetime
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from input_loading import render_row_labels
+
+# Sheet names used for the Saiba and Lombard data in every workbook
+SAIBA_SHEET = 'Saiba_Dump'
+LOMBARD_SHEET = 'Lombard_Statement'
+
+# Columnar format for the data handed from one stage to the next ('feather' or 'parquet')
+WORKING_FORMAT = 'feather'
+
+# Feather files are left uncompressed so they can be memory-mapped on load
+FEATHER_COMPRESSION = 'uncompressed'
+
+# Schema metadata key listing the columns stored as tagged text, and the key
+# older versions used for columns stored as pickled values (no longer read)
+TAGGED_COLUMNS_KEY = b'tagged_columns'
+PICKLED_COLUMNS_KEY = b'pickled_columns'
+
+# Value types a column mixing types may hold (e.g. ints and strings in
+# PRODUCT_CODE). Each value is stored as '<tag>:<text>' and read back as the
+# same type; missing values (None) stay missing. Subclasses come before their
+# base types (bool before int, Timestamp before datetime before date).
+VALUE_TAGS = [
+    ('b', (bool, np.bool_), lambda value: str(bool(value)), lambda text: text == 'True'),
+    ('i', (int, np.integer), lambda value: str(int(value)), int),
+    ('f', (float, np.floating), lambda value: repr(float(value)), float),
+    ('s', str, str, str),
+    ('n', type(pd.NaT), lambda value: '', lambda text: pd.NaT),
+    ('T', pd.Timestamp, lambda value: value.isoformat(), pd.Timestamp),
+    ('d', datetime.datetime, lambda value: value.isoformat(), datetime.datetime.fromisoformat),
+    ('D', datetime.date, lambda value: value.isoformat(), datetime.date.fromisoformat),
+    ('h', datetime.time, lambda value: value.isoformat(), datetime.time.fromisoformat),
+]
+
+# Intermediate datasets that can be exported to Excel
+WORKING_DATASETS = ['Combined_Data', 'Matched_Data', 'Unmatched_Data']
+
+
+# Rows converted to Python values at a time while streaming a sheet
+EXCEL_CHUNK_ROWS = 10_000
+
+# Cell values as xlsxwriter takes them, a chunk of rows at a time; missing values become blank cells
+def excel_rows(df):
+    for start in range(0, len(df), EXCEL_CHUNK_ROWS):
+        chunk = df.iloc[start:start + EXCEL_CHUNK_ROWS]
+        columns = []
+        for i in range(chunk.shape[1]):
+            values = chunk.iloc[:, i].astype(object)
+            columns.append(values.where(values.notna(), None).tolist())
+        yield from zip(*columns)
+
+def write_sheet(workbook, sheet_name, df):
+    worksheet = workbook.add_worksheet(sheet_name)
+    worksheet.write_row(0, 0, [str(col) for col in df.columns], workbook.add_format({'bold': True, 'border': 1}))
+    for row, values in enumerate(excel_rows(df), start=1):
+        worksheet.write_row(row, 0, values)
+
+def write_sheets(file_path, saiba_data, lombard_data):
+    import xlsxwriter
+
+    # Save both datasets to an Excel file with two sheets. In constant_memory
+    # mode each row is flushed to disk once the next one starts, so the
+    # workbook is never held in memory; text is written as text, never as a
+    # formula or link.
+    workbook = xlsxwriter.Workbook(file_path, {
+        'constant_memory': True,
+        'default_date_format': 'yyyy-mm-dd hh:mm:ss',
+        'strings_to_formulas': False,
+        'strings_to_urls': False,
+    })
+    with workbook:
+        write_sheet(workbook, SAIBA_SHEET, saiba_data)
+        write_sheet(workbook, LOMBARD_SHEET, lombard_data)
+
+
+# #### Columnar working data
+
+def working_path(name, sheet, working_format=WORKING_FORMAT):
+    return f'{name}_{sheet}.{working_format}'
+
+def tag_value(value, col):
+    if value is None:
+        return None
+    for tag, types, to_text, _ in VALUE_TAGS:
+        if isinstance(value, types):
+            return f'{tag}:{to_text(value)}'
+    raise TypeError(f"Cannot store {type(value).__name__} values of column {col!r} in the working data")
+
+def untag_value(text):
+    if text is None:
+        return None
+    tag, text = text.split(':', 1)
+    return next(from_text for value_tag, _, _, from_text in VALUE_TAGS if value_tag == tag)(text)
+
+def frame_to_table(df):
+    import pyarrow as pa
+
+    # Columns Arrow cannot type (e.g. ints mixed with strings in PRODUCT_CODE)
+    # are stored as tagged text so every cell comes back exactly as it was
+    df = df.reset_index(drop=True)
+    tagged_columns = []
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        try:
+            pa.array(df[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            df[col] = pd.Series([tag_value(value, col) for value in df[col]], dtype=object)
+            tagged_columns.append(col)
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[TAGGED_COLUMNS_KEY] = json.dumps(tagged_columns).encode('utf-8')
+    return table.replace_schema_metadata(metadata)
+
+def table_to_frame(table):
+    metadata = table.schema.metadata or {}
+    if PICKLED_COLUMNS_KEY in metadata:
+        raise ValueError("Working data written by an older version (pickled columns); run the stages again")
+    df = table.to_pandas()
+    for col in json.loads(metadata.get(TAGGED_COLUMNS_KEY, b'[]')):
+        df[col] = pd.Series([untag_value(text) for text in table.column(col).to_pylist()], index=df.index, dtype=object)
+    return df
+
+def write_table(path, df, working_format=WORKING_FORMAT):
+    table = frame_to_table(df)
+    if working_format == 'feather':
+        from pyarrow import feather
+        feather.write_feather(table, path, compression=FEATHER_COMPRESSION)
+    elif working_format == 'parquet':
+        from pyarrow import parquet
+        parquet.write_table(table, path)
+    else:
+        raise ValueError(f"Unknown working format: {working_format}")
+
+def read_table(path, working_format=WORKING_FORMAT, memory_map=True):
+    if working_format == 'feather':
+        from pyarrow import feather
+        table = feather.read_table(path, memory_map=memory_map)
+    elif working_format == 'parquet':
+        from pyarrow import parquet
+        table = parquet.read_table(path, memory_map=memory_map)
+    else:
+        raise ValueError(f"Unknown working format: {working_format}")
+    return table_to_frame(table)
+
+def save_working_data(name, saiba_data, lombard_data, working_format=WORKING_FORMAT):
+    # Save both datasets in the columnar working format
+    write_table(working_path(name, SAIBA_SHEET, working_format), saiba_data, working_format)
+    write_table(working_path(name, LOMBARD_SHEET, working_format), lombard_data, working_format)
+
+def load_working_data(name, working_format=WORKING_FORMAT, memory_map=True):
+    # Load both datasets back from the columnar working format
+    saiba_data = read_table(working_path(name, SAIBA_SHEET, working_format), working_format, memory_map)
+    lombard_data = read_table(working_path(name, LOMBARD_SHEET, working_format), working_format, memory_map)
+    return saiba_data, lombard_data
+
+def export_working_data(name, working_format=WORKING_FORMAT):
+    # Write a working dataset out as an Excel file with two sheets
+    saiba_data, lombard_data = render_row_labels(*load_working_data(name, working_format))
+    write_sheets(f'{name}.xlsx', saiba_data, lombard_data)
+
+
+if __name__ == "__main__":
+    # Export the working data left by the stage scripts to Excel
+    for name in WORKING_DATASETS:
+        if os.path.exists(working_path(name, SAIBA_SHEET)):
+            print(f"Exporting {name}.xlsx...")
+            export_working_data(name)